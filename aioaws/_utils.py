@@ -5,23 +5,48 @@ from typing import TYPE_CHECKING, Any
 
 from httpx import Response
 
+try:
+    # SIMD accelerated base64, a drop-in replacement for the stdlib functions
+    from pybase64 import b64decode, b64encode
+except ImportError:
+    from base64 import b64decode, b64encode
+try:
+    # parses bytes directly and several times faster than the stdlib
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+try:
+    # opt-in via the fast_json config flag since its output is more compact than json.dumps
+    from orjson import dumps as json_dumps
+except ImportError:
+    json_dumps = None  # type: ignore[assignment]
+
 if TYPE_CHECKING:
     from ._types import BaseConfigProtocol
 
-__all__ = 'get_config_attr', 'utcnow', 'ManyTasks', 'pretty_xml', 'pretty_response'
+__all__ = (
+    'get_config_attr',
+    'utcnow',
+    'ManyTasks',
+    'pretty_xml',
+    'pretty_response',
+    'b64decode',
+    'b64encode',
+    'json_loads',
+    'json_dumps',
+)
 
-EPOCH = datetime(1970, 1, 1)
-EPOCH_TZ = EPOCH.replace(tzinfo=timezone.utc)
 
+_missing = object()
 
-def get_config_attr(config: 'BaseConfigProtocol', name: str) -> str:
-    try:
-        s = getattr(config, name)
-    except AttributeError:
-        raise TypeError(f'config has not attribute {name}')
 
+def get_config_attr(config: 'BaseConfigProtocol', name: str) -> str:
+    # a default avoids raising and catching AttributeError when the attribute is missing
+    s = getattr(config, name, _missing)
     if isinstance(s, str):
         return s
+    elif s is _missing:
+        raise TypeError(f'config has not attribute {name}')
     else:
         raise TypeError(f'config.{name} must be a string not {s.__class__.__name__}')
 
@@ -40,20 +65,36 @@ class ManyTasks:
     def __init__(self) -> None:
         self._tasks: list[asyncio.Task[Any]] = []
 
-    def add(self, coroutine: Coroutine[Any, Any, list[str]], *, name: str | None = None) -> None:
+    def add(self, coroutine: Coroutine[Any, Any, Any], *, name: str | None = None) -> None:
         task = asyncio.create_task(coroutine, name=name)
         self._tasks.append(task)
 
     async def finish(self) -> Iterable[Any]:
-        return await asyncio.gather(*self._tasks)
+        tasks = self._tasks
+        # reset before waiting so the instance can be reused, even if one of the tasks fails
+        self._tasks = []
+        try:
+            # gather cancels the tasks if finish() is cancelled and raises the first error as soon as it happens
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # gather leaves the other tasks running when one fails, cancel them and wait for them to stop so nothing
+            # carries on in the background after the caller has seen the error
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
 
 
 def pretty_xml(response_xml: bytes) -> str:
+    # anything not starting with a tag can't be XML, skip importing and running the parser
+    if response_xml.lstrip()[:1] != b'<':
+        return response_xml.decode()
+
     import xml.dom.minidom
 
     try:
         pretty = xml.dom.minidom.parseString(response_xml).toprettyxml(indent='  ')
-    except Exception:  # pragma: no cover
+    except Exception:
         return response_xml.decode()
     else:
         return f'{pretty} (XML formatted by aioaws)'
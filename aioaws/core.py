@@ -1,11 +1,13 @@
+import asyncio
 import base64
 import hashlib
 import hmac
 import logging
+import re
 from binascii import hexlify
 from collections.abc import Generator
 from datetime import datetime
-from functools import reduce
+from functools import lru_cache, reduce
 from typing import TYPE_CHECKING, Any, Literal
 from urllib.parse import quote as url_quote
 
@@ -22,6 +24,13 @@ logger = logging.getLogger('aioaws.core')
 _AWS_AUTH_REQUEST = 'aws4_request'
 _CONTENT_TYPE = 'application/x-www-form-urlencoded'
 _AUTH_ALGORITHM = 'AWS4-HMAC-SHA256'
+# sha256 and base64 md5 of an empty payload, used for every GET request
+_EMPTY_SHA256 = 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+_EMPTY_MD5 = '1B2M2Y8AsgTpgAmY7PhCfg=='
+# bodies larger than this are hashed in a thread to avoid blocking the event loop, hashlib releases the GIL
+_THREAD_HASH_SIZE = 256 * 1024
+# paths made up only of these characters are unchanged by url_quote, so quoting can be skipped
+_UNRESERVED_PATH_RE = re.compile('[A-Za-z0-9_.~/-]*')
 
 
 class AwsClient:
@@ -102,12 +111,13 @@ class AwsClient:
         content_type: str | None = None,
     ) -> Response:
         url = URL(f'{self.endpoint}{path}', params=[(k, v) for k, v in sorted((params or {}).items())])
-        r = await self.client.request(
-            method,
-            url,
-            content=data,
-            headers=self._auth.auth_headers(method, url, data=data, content_type=content_type),
-        )
+        if data is not None and len(data) > _THREAD_HASH_SIZE:
+            headers = await asyncio.to_thread(
+                self._auth.auth_headers, method, url, data=data, content_type=content_type
+            )
+        else:
+            headers = self._auth.auth_headers(method, url, data=data, content_type=content_type)
+        r = await self.client.request(method, url, content=data, headers=headers)
         if r.status_code != 200:
             # from ._utils import pretty_response
             # pretty_response(r)
@@ -158,6 +168,10 @@ class AWSv4Auth:
         self.aws_access_key = aws_access_key
         self.region = region
         self.service = service
+        # everything in the credential scope except the date is fixed for the life of the instance
+        self._scope_suffix = f'/{region}/{service}/{_AWS_AUTH_REQUEST}'
+        # authorization header up to the signature, only changes with the date, keyed on (date stamp, signed headers)
+        self._authorization_prefix: tuple[str, str, str] = ('', '', '')
 
     def auth_headers(
         self,
@@ -171,21 +185,27 @@ class AWSv4Auth:
         data = data or b''
         content_type = content_type or _CONTENT_TYPE
 
+        # md5 is only a transport checksum here, so allow it on FIPS builds of OpenSSL
+        content_md5 = (
+            base64.b64encode(hashlib.md5(data, usedforsecurity=False).digest()).decode() if data else _EMPTY_MD5
+        )
+
         # WARNING! order is important here, headers need to be in alphabetical order
         headers = {
-            'content-md5': base64.b64encode(hashlib.md5(data).digest()).decode(),
+            'content-md5': content_md5,
             'content-type': content_type,
             'host': url.host,
             'x-amz-date': _aws4_x_amz_date(now),
         }
 
-        payload_sha256_hash = hashlib.sha256(data).hexdigest()
+        payload_sha256_hash = hashlib.sha256(data).hexdigest() if data else _EMPTY_SHA256
         signed_headers, signature = self.aws4_signature(now, method, url, headers, payload_sha256_hash)
-        credential = self.aws4_credential(now)
-        authorization_header = (
-            f'{_AUTH_ALGORITHM} Credential={credential},SignedHeaders={signed_headers},Signature={signature}'
+        headers.update(
+            {
+                'authorization': self._aws4_authorization_prefix(now, signed_headers) + signature,
+                'x-amz-content-sha256': payload_sha256_hash,
+            }
         )
-        headers.update({'authorization': authorization_header, 'x-amz-content-sha256': payload_sha256_hash})
         return headers
 
     def aws4_signature(
@@ -195,7 +215,7 @@ class AWSv4Auth:
         signed_headers = ';'.join(header_keys)
         canonical_request_parts = (
             method,
-            url_quote(url.path),
+            _aws4_quote_path(url.path),
             url.query.decode(),
             ''.join(f'{k}:{headers[k]}\n' for k in header_keys),
             signed_headers,
@@ -212,23 +232,27 @@ class AWSv4Auth:
         return signed_headers, self.aws4_sign_string(string_to_sign, dt)
 
     def aws4_sign_string(self, string_to_sign: str, dt: datetime) -> str:
-        key_parts = (
-            b'AWS4' + self.aws_secret_key.encode(),
-            _aws4_date_stamp(dt),
-            self.region,
-            self.service,
-            _AWS_AUTH_REQUEST,
-            string_to_sign,
-        )
-        signature_bytes: bytes = reduce(_aws4_reduce_signature, key_parts)  # type: ignore
+        signature_bytes = _aws4_reduce_signature(self._aws4_signing_key(_aws4_date_stamp(dt)), string_to_sign)
         return hexlify(signature_bytes).decode()
 
+    def _aws4_signing_key(self, date_stamp: str) -> bytes:
+        return _aws4_derive_signing_key(self.aws_secret_key, date_stamp, self.region, self.service)
+
     def _aws4_scope(self, dt: datetime) -> str:
-        return f'{_aws4_date_stamp(dt)}/{self.region}/{self.service}/{_AWS_AUTH_REQUEST}'
+        return _aws4_date_stamp(dt) + self._scope_suffix
 
     def aws4_credential(self, dt: datetime) -> str:
         return f'{self.aws_access_key}/{self._aws4_scope(dt)}'
 
+    def _aws4_authorization_prefix(self, dt: datetime, signed_headers: str) -> str:
+        date_stamp = _aws4_date_stamp(dt)
+        cached_date_stamp, cached_signed_headers, prefix = self._authorization_prefix
+        if date_stamp != cached_date_stamp or signed_headers != cached_signed_headers:
+            credential = self.aws4_credential(dt)
+            prefix = f'{_AUTH_ALGORITHM} Credential={credential},SignedHeaders={signed_headers},Signature='
+            self._authorization_prefix = date_stamp, signed_headers, prefix
+        return prefix
+
 
 class AWSV4AuthFlow(Auth):
     def __init__(
@@ -256,16 +280,31 @@ class AWSV4AuthFlow(Auth):
         yield request
 
 
+def _aws4_quote_path(path: str) -> str:
+    return path if _UNRESERVED_PATH_RE.fullmatch(path) else url_quote(path)
+
+
+# formatted by hand rather than with strftime which is slower and called several times per signature
 def _aws4_date_stamp(dt: datetime) -> str:
-    return dt.strftime('%Y%m%d')
+    return f'{dt.year:04d}{dt.month:02d}{dt.day:02d}'
 
 
 def _aws4_x_amz_date(dt: datetime) -> str:
-    return dt.strftime('%Y%m%dT%H%M%SZ')
+    return f'{dt.year:04d}{dt.month:02d}{dt.day:02d}T{dt.hour:02d}{dt.minute:02d}{dt.second:02d}Z'
+
+
+@lru_cache(maxsize=32)
+def _aws4_derive_signing_key(aws_secret_key: str, date_stamp: str, region: str, service: str) -> bytes:
+    """
+    The signing key only changes with the date, cache it at module level so it's shared between clients
+    (which are often created per request) with the same credentials.
+    """
+    key_parts = b'AWS4' + aws_secret_key.encode(), date_stamp, region, service, _AWS_AUTH_REQUEST
+    return reduce(_aws4_reduce_signature, key_parts)  # type: ignore
 
 
 def _aws4_reduce_signature(key: bytes, msg: str) -> bytes:
-    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+    return hmac.digest(key, msg.encode(), 'sha256')
 
 
 class RequestError(RuntimeError):
@@ -3,17 +3,18 @@ import builtins
 import json
 import mimetypes
 import re
-from collections.abc import AsyncIterable
+from collections.abc import AsyncIterable, Iterable
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from itertools import chain
 from typing import TYPE_CHECKING, Any, Literal
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape as xml_escape
 
 from httpx import URL, AsyncClient
 from pydantic import BaseModel, ConfigDict, field_validator
 
-from ._utils import ManyTasks, pretty_xml, utcnow
+from ._utils import ManyTasks, json_dumps, pretty_xml, utcnow
 from .core import AwsClient, RequestError
 
 if TYPE_CHECKING:
@@ -26,6 +27,10 @@ expiry_rounding = 100
 # removing xmlns="http://s3.amazonaws.com/doc/2006-03-01/" from xml makes it much easier to parse
 xmlns = 'http://s3.amazonaws.com/doc/2006-03-01/'
 xmlns_re = re.compile(f' xmlns="{re.escape(xmlns)}"'.encode())
+delete_xml_start = f'<?xml version="1.0" encoding="UTF-8"?><Delete xmlns="{xmlns}">'.encode()
+delete_xml_end = b'</Delete>'
+# characters which must be escaped in XML text, most keys contain none so escaping can be skipped
+xml_special_re = re.compile('[&<>]')
 
 
 @dataclass
@@ -36,6 +41,9 @@ class S3Config:
     aws_s3_bucket: str
     # custom host to connect with
     aws_host: str | None = None
+    # serialize upload policies with orjson if it's installed, the policy is compact JSON rather than json.dumps's
+    # default formatting, S3 accepts either
+    fast_json: bool = False
 
 
 def alias_generator(string: str) -> str:
@@ -75,15 +83,21 @@ class S3Client:
             params = {'list-type': 2, 'prefix': prefix, 'continuation-token': continuation_token}
             r = await self._aws_client.get(params={k: v for k, v in params.items() if v is not None})
 
-            xml_root = ElementTree.fromstring(xmlns_re.sub(b'', r.content))
-            for c in xml_root.findall('Contents'):
-                yield S3File.model_validate({v.tag: v.text for v in c})
-            if (t := xml_root.find('IsTruncated')) is not None and t.text == 'false':
+            # single pass over the top level elements, tags are compared without their namespace (if any)
+            # so there's no need to strip xmlns from the whole body first
+            is_truncated = continuation_token = None
+            for el in ElementTree.fromstring(r.content):
+                tag = el.tag.rpartition('}')[2]
+                if tag == 'Contents':
+                    yield S3File.model_validate({v.tag.rpartition('}')[2]: v.text for v in el})
+                elif tag == 'IsTruncated':
+                    is_truncated = el.text
+                elif tag == 'NextContinuationToken':
+                    continuation_token = el.text
+
+            if is_truncated == 'false':
                 break
-
-            if (t := xml_root.find('NextContinuationToken')) is not None:
-                continuation_token = t.text
-            else:
+            elif continuation_token is None:
                 raise RuntimeError(f'unexpected response from S3:\n{pretty_xml(r.content)}')
 
     async def delete(self, *files: str | S3File) -> builtins.list[str]:
@@ -114,6 +128,27 @@ class S3Client:
         )
         await self._aws_client.raw_post(d['url'], expected_status=204, data=d['fields'], files={'file': content})
 
+    async def upload_many(self, files: Iterable[tuple[str, bytes]], *, concurrency: int = 16) -> None:
+        """
+        Upload many files concurrently, files should be pairs of (file_path, content).
+
+        At most `concurrency` uploads are in flight at once, this avoids exhausting the http client's connection pool
+        when uploading a large number of files. `files` is consumed lazily so it may be a generator which reads
+        content from disk as it's needed.
+        """
+        assert concurrency >= 1, f'concurrency must be greater than or equal to 1, not {concurrency}'
+        files_iter = iter(files)
+
+        async def worker() -> None:
+            # workers share one iterator so each takes the next file as soon as its previous upload finishes
+            for file_path, content in files_iter:
+                await self.upload(file_path, content)
+
+        tasks = ManyTasks()
+        for _ in range(concurrency):
+            tasks.add(worker())
+        await tasks.finish()
+
     async def delete_recursive(self, prefix: str | None) -> builtins.list[str]:
         """
         Delete files starting with a specific prefix.
@@ -136,13 +171,9 @@ class S3Client:
         https://docs.aws.amazon.com/AmazonS3/latest/API/API_DeleteObjects.html
         """
         assert len(files) <= 1000, f'_delete_1000_files can delete 1000 files max, not {len(files)}'
-        xml = (
-            f'<?xml version="1.0" encoding="UTF-8"?>'
-            f'<Delete xmlns="{xmlns}">'
-            f' {"".join(f"<Object><Key>{to_key(k)}</Key></Object>" for k in files)}'
-            f'</Delete>'
-        )
-        r = await self._aws_client.post('', data=xml.encode(), params=dict(delete=1), content_type='text/xml')
+        objects = [b'<Object><Key>' + _escape_key(to_key(k)).encode() + b'</Key></Object>' for k in files]
+        xml = b''.join([delete_xml_start, *objects, delete_xml_end])
+        r = await self._aws_client.post('', data=xml, params=dict(delete=1), content_type='text/xml')
         xml_root = ElementTree.fromstring(xmlns_re.sub(b'', r.content))
         return [k.find('Key').text for k in xml_root]  # type: ignore
 
@@ -211,7 +242,11 @@ class S3Client:
             'expiration': f'{expires or now + timedelta(seconds=60):%Y-%m-%dT%H:%M:%SZ}',
             'conditions': policy_conditions,
         }
-        b64_policy = base64.b64encode(json.dumps(policy).encode()).decode()
+        if json_dumps is not None and getattr(self._config, 'fast_json', False):
+            policy_json = json_dumps(policy)
+        else:
+            policy_json = json.dumps(policy).encode()
+        b64_policy = base64.b64encode(policy_json).decode()
 
         fields = {
             'Key': key,
@@ -223,8 +258,17 @@ class S3Client:
         return dict(url=f'{self._aws_client.endpoint}/', fields=fields)
 
 
+def _escape_key(key: str) -> str:
+    return xml_escape(key) if xml_special_re.search(key) else key
+
+
 def to_key(sf: S3File | str) -> str:
-    if isinstance(sf, str):
+    # exact type checks first, they're cheaper than isinstance, particularly pydantic's ModelMetaclass.__instancecheck__
+    if type(sf) is str:
+        return sf
+    elif type(sf) is S3File:
+        return sf.key
+    elif isinstance(sf, str):
         return sf
     elif isinstance(sf, S3File):
         return sf.key
@@ -1,4 +1,3 @@
-import base64
 import json
 import logging
 import re
@@ -11,6 +10,8 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from httpx import AsyncClient
 from pydantic import BaseModel, Field, HttpUrl, ValidationError, field_validator
 
+from ._utils import b64decode
+
 __all__ = 'SnsWebhookError', 'SnsPayload', 'verify_webhook'
 logger = logging.getLogger('aioaws.sns')
 
@@ -33,7 +34,7 @@ class SnsPayload(BaseModel):
 
     @field_validator('signature', mode='before')
     def base64_signature(cls, sig: str) -> bytes:
-        return base64.b64decode(sig)
+        return b64decode(sig)
 
 
 async def verify_webhook(request_body: str | bytes, http_client: AsyncClient) -> SnsPayload | None:
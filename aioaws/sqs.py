@@ -1,11 +1,14 @@
+import asyncio
+import importlib.util
 from collections.abc import AsyncIterator, Iterable, Mapping
 from contextlib import AsyncExitStack, asynccontextmanager
 from dataclasses import dataclass
 from typing import Any
 
-from httpx import AsyncClient, Timeout
+from httpx import URL, AsyncClient, Limits, Timeout
 from pydantic import BaseModel, Field
 
+from ._utils import json_loads
 from .core import AWSV4AuthFlow
 
 
@@ -24,21 +27,33 @@ class SQSMessage(BaseModel):
 
 
 class PollConfig(BaseModel):
-    wait_time: int = Field(default=10, gt=0)
-    max_messages: int = Field(default=1, ge=1, le=10)
+    # long poll for the maximum SQS allows to minimise empty receives, 0 disables long polling
+    wait_time: int = Field(default=20, ge=0, le=20)
+    # SQS returns at most 10 messages per ReceiveMessage call, fetch a full batch per round trip by default
+    max_messages: int = Field(default=10, ge=1, le=10)
+    # number of ReceiveMessage requests to keep in flight, messages from later requests wait in memory while earlier
+    # batches are processed so the queue's visibility timeout should allow for that
+    concurrency: int = Field(default=1, ge=1)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class _QueueName:
     name: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class _QueueURL:
     url: str
 
 
 MAX_VISIBILITY_TIMEOUT = 12 * 60 * 60  # 12 hours in seconds
+MAX_BATCH_SIZE = 10  # maximum number of entries in a batch request
+_json_headers = {'Accept': 'application/json'}
+# http2 needs the optional h2 package, check for it without importing it
+_http2 = importlib.util.find_spec('h2') is not None
+# pool limits for the client create_sqs_client builds when none is passed: keep every connection alive between polls
+# so the TCP and TLS handshakes are only paid once per connection
+_default_limits = Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=30)
 
 
 class SQSClient:
@@ -76,10 +91,10 @@ class SQSClient:
                 'QueueName': queue_name,
             },
             auth=auth,
-            headers={'Accept': 'application/json'},
+            headers=_json_headers,
         )
         resp.raise_for_status()
-        return resp.json()['GetQueueUrlResponse']['GetQueueUrlResult']['QueueUrl']
+        return json_loads(resp.content)['GetQueueUrlResponse']['GetQueueUrlResult']['QueueUrl']
 
     async def _get_queue_url(self) -> str:
         if isinstance(self._queue_name_or_url, _QueueName):
@@ -99,36 +114,59 @@ class SQSClient:
     ) -> AsyncIterator[Iterable[SQSMessage]]:
         config = config or PollConfig()
         queue_url = await self._get_queue_url()
-        while True:
-            resp = await self._client.get(
-                url=queue_url,
-                params={
-                    'Action': 'ReceiveMessage',
-                    'MaxNumberOfMessages': config.max_messages,
-                    'WaitTimeSeconds': config.wait_time,
-                },
-                headers={
-                    'Accept': 'application/json',
-                },
-                timeout=Timeout(
-                    5,  # htppx's default timeout
-                    # arbitrary selection of 1.5x wait time
-                    # to avoid http timeouts while long polling
-                    read=config.wait_time * 1.5,
-                ),
-                auth=self._auth,
+        # everything but the signature is the same for every request, so build the url once rather than having httpx
+        # encode and merge params each time
+        poll_url = URL(
+            f'{queue_url}?Action=ReceiveMessage'
+            f'&MaxNumberOfMessages={config.max_messages}&WaitTimeSeconds={config.wait_time}'
+        )
+        timeout = Timeout(
+            5,  # htppx's default timeout
+            # arbitrary selection of 1.5x wait time
+            # to avoid http timeouts while long polling
+            read=max(5, config.wait_time * 1.5),
+        )
+        if config.concurrency == 1:
+            while True:
+                yield await self._receive(poll_url, timeout)
+        else:
+            # keep a fixed number of requests in flight, replacing each as it completes
+            tasks = {asyncio.create_task(self._receive(poll_url, timeout)) for _ in range(config.concurrency)}
+            try:
+                while True:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        tasks.remove(task)
+                        messages = task.result()
+                        tasks.add(asyncio.create_task(self._receive(poll_url, timeout)))
+                        yield messages
+            finally:
+                # stop outstanding requests, and retrieve any errors from completed ones which were never yielded
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _receive(self, poll_url: URL, timeout: Timeout) -> list[SQSMessage]:
+        resp = await self._client.get(
+            url=poll_url,
+            headers=_json_headers,
+            timeout=timeout,
+            auth=self._auth,
+        )
+        resp.raise_for_status()
+        # parse the raw bytes, this avoids resp.json() decoding to text first
+        data = json_loads(resp.content)
+        return [
+            # the data comes straight from SQS, skip validation
+            SQSMessage.model_construct(
+                message_id=message_data['MessageId'],
+                receipt_handle=message_data['ReceiptHandle'],
+                md5_of_body=message_data['MD5OfBody'],
+                body=message_data['Body'],
+                attributes=message_data['Attributes'],
             )
-            resp.raise_for_status()
-            yield [
-                SQSMessage.model_construct(
-                    message_id=message_data['MessageId'],
-                    receipt_handle=message_data['ReceiptHandle'],
-                    md5_of_body=message_data['MD5OfBody'],
-                    body=message_data['Body'],
-                    attributes=message_data['Attributes'],
-                )
-                for message_data in resp.json()['ReceiveMessageResponse']['ReceiveMessageResult']['messages'] or ()
-            ]
+            for message_data in data['ReceiveMessageResponse']['ReceiveMessageResult']['messages'] or ()
+        ]
 
     async def change_visibility(self, message: SQSMessage, timeout: int) -> None:
         queue_url = await self._get_queue_url()
@@ -142,9 +180,7 @@ class SQSClient:
                 'ReceiptHandle': message.receipt_handle,
             },
             auth=self._auth,
-            headers={
-                'Accept': 'application/json',
-            },
+            headers=_json_headers,
         )
 
     async def delete_message(self, message: SQSMessage) -> None:
@@ -156,12 +192,36 @@ class SQSClient:
                 'ReceiptHandle': message.receipt_handle,
             },
             auth=self._auth,
-            headers={
-                'Accept': 'application/json',
-            },
+            headers=_json_headers,
         )
         resp.raise_for_status()
 
+    async def delete_messages(self, messages: Iterable[SQSMessage]) -> list[SQSMessage]:
+        """
+        Delete messages with one DeleteMessageBatch request per 10 messages, rather than one request per message.
+
+        SQS reports entries it failed to delete in the response body rather than with an error status, those messages
+        are returned so the caller can retry or log them, an empty list means every message was deleted.
+
+        https://docs.aws.amazon.com/AWSSimpleQueueService/latest/APIReference/API_DeleteMessageBatch.html
+        """
+        queue_url = await self._get_queue_url()
+        messages = list(messages)
+        failed: list[SQSMessage] = []
+        for start in range(0, len(messages), MAX_BATCH_SIZE):
+            batch = messages[start : start + MAX_BATCH_SIZE]
+            params = {'Action': 'DeleteMessageBatch'}
+            for i, message in enumerate(batch, start=1):
+                params[f'DeleteMessageBatchRequestEntry.{i}.Id'] = str(i)
+                params[f'DeleteMessageBatchRequestEntry.{i}.ReceiptHandle'] = message.receipt_handle
+            resp = await self._client.post(url=queue_url, params=params, auth=self._auth, headers=_json_headers)
+            resp.raise_for_status()
+            result = json_loads(resp.content)['DeleteMessageBatchResponse']['DeleteMessageBatchResult']
+            # like "messages" in ReceiveMessageResult, list members may be lower case in SQS's JSON responses
+            failed_entries = result.get('Failed') or result.get('failed') or ()
+            failed.extend(batch[int(entry['Id']) - 1] for entry in failed_entries)
+        return failed
+
 
 @asynccontextmanager
 async def create_sqs_client(
@@ -172,7 +232,7 @@ async def create_sqs_client(
 ) -> AsyncIterator[SQSClient]:
     async with AsyncExitStack() as stack:
         if client is None:
-            client = await stack.enter_async_context(AsyncClient())
+            client = await stack.enter_async_context(AsyncClient(limits=_default_limits, http2=_http2))
             assert client is not None  # for mypy
         yield SQSClient(
             queue_name_or_url=queue,
@@ -1,29 +1,58 @@
-import base64
-from collections.abc import Iterable
+import quopri
+import re
+from collections.abc import Iterable, Iterator
 from email import message_from_bytes
 from email.header import decode_header as _decode_header
+from email.message import Message
 from typing import Any
 from uuid import uuid4
 
+from ._utils import b64decode
+
 __all__ = 'ses_email_data', 'ses_send_response'
 
+# RFC 2047 encoded words, e.g. "=?utf-8?b?wqPCo8Kj?="
+_encoded_word_re = re.compile(r'=\?([^?]+)\?([BbQq])\?([^?]*)\?=')
+# whitespace between two adjacent encoded words is not part of the decoded value
+_encoded_word_gap_re = re.compile(r'(?<=\?=)\s+(?==\?)')
+
+_send_response_template = (
+    '<SendRawEmailResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">\n'
+    '  <SendRawEmailResult>\n'
+    '    <MessageId>{message_id}</MessageId>\n'
+    '  </SendRawEmailResult>\n'
+    '  <ResponseMetadata>\n'
+    '    <RequestId>{request_id}</RequestId>\n'
+    '  </ResponseMetadata>\n'
+    '</SendRawEmailResponse>\n'
+)
+
 
 def ses_email_data(data: dict[str, str]) -> dict[str, Any]:
     """
     Convert raw email body data to a useful representation of an email for testing.
     """
-    msg_raw = base64.b64decode(data['RawMessage.Data'])
+    msg_raw = b64decode(data['RawMessage.Data'])
     msg = message_from_bytes(msg_raw)
     d: dict[str, Any] = {}
+    # iterate over all headers so the last value wins when a header is repeated
     for k, v in msg.items():
-        if k != 'Content-Type':
-            d[k] = ''.join(decode_header(v))
+        if k == 'Content-Type':
+            continue
+        # plain ASCII headers without RFC 2047 encoded words are left as they are
+        if not isinstance(v, str):
+            v = decode_header(v)
+        elif not v.isascii() or '=?' in v:
+            v = _fast_decode_header(v)
+        d[k] = v
 
     d['payload'] = []
-    for part in msg.walk():
+    # most emails are single part, skip walking the MIME tree for them
+    parts: Iterable[Message] = _iter_parts(msg) if msg.is_multipart() else (msg,)
+    for part in parts:
         if payload := part.get_payload(decode=True):
             assert isinstance(payload, bytes), f'expected payload to be bytes, got {type(payload)}'
-            part_info = {'Content-Type': part.get_content_type(), 'payload': payload.decode().replace('\r\n', '\n')}
+            part_info = {'Content-Type': part.get_content_type(), 'payload': payload.replace(b'\r\n', b'\n').decode()}
             for key in 'Content-Disposition', 'Content-ID':
                 if cd := part[key]:
                     part_info[key] = cd
@@ -36,21 +65,49 @@ def ses_send_response(message_id: str | None = None, request_id: str | None = No
     """
     Dummy response to SendRawEmail SES endpoint
     """
-    return (
-        f'<SendRawEmailResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">\n'
-        f'  <SendRawEmailResult>\n'
-        f'    <MessageId>{message_id or uuid4()}</MessageId>\n'
-        f'  </SendRawEmailResult>\n'
-        f'  <ResponseMetadata>\n'
-        f'    <RequestId>{request_id or uuid4()}</RequestId>\n'
-        f'  </ResponseMetadata>\n'
-        f'</SendRawEmailResponse>\n'
-    )
-
-
-def decode_header(header: str) -> Iterable[str]:
-    for part, encoding in _decode_header(header):
-        if isinstance(part, str):
-            yield part
+    return _send_response_template.format(message_id=message_id or uuid4(), request_id=request_id or uuid4())
+
+
+def _iter_parts(msg: Message) -> Iterator[Message]:
+    """
+    Yield the leaf (non-multipart) parts of a message in the same order as msg.walk().
+    """
+    stack = [msg]
+    while stack:
+        part = stack.pop()
+        if part.is_multipart():
+            stack.extend(reversed(part.get_payload()))  # type: ignore
         else:
-            yield part.decode(encoding or 'utf8')
+            yield part
+
+
+def _fast_decode_header(header: str) -> str:
+    """
+    Decode RFC 2047 encoded words with a single regex substitution, falling back to email.header.decode_header
+    for anything the regex can't handle.
+    """
+    if '=?' not in header:
+        return header
+    if '\n' in header:
+        # folded headers need unfolding around the encoded words, leave that to the email package
+        return decode_header(header)
+    try:
+        return _encoded_word_re.sub(_decode_encoded_word, _encoded_word_gap_re.sub('', header))
+    except (LookupError, ValueError):
+        return decode_header(header)
+
+
+def _decode_encoded_word(m: re.Match[str]) -> str:
+    charset, encoding, text = m.groups()
+    if encoding in 'Bb':
+        raw = b64decode(text)
+    else:
+        raw = quopri.decodestring(text.encode(), header=True)
+    return raw.decode(charset)
+
+
+def decode_header(header: str) -> str:
+    parts = _decode_header(header)
+    if len(parts) == 1 and isinstance(parts[0][0], str):
+        return parts[0][0]
+    return ''.join(part if isinstance(part, str) else part.decode(encoding or 'utf8') for part, encoding in parts)
@@ -8,6 +8,10 @@ import pytest
 from foxglove.testing import DummyServer, create_dummy_server
 from httpx import URL, AsyncClient
 
+from aioaws.s3 import S3Client, S3Config
+from aioaws.ses import SesClient, SesConfig
+from aioaws.sqs import AWSAuthConfig, SQSClient
+
 from . import dummy_server
 
 
@@ -25,12 +29,31 @@ def _fix_aws(loop):
     loop.run_until_complete(ds.stop())
 
 
+def _sns_path(url: URL) -> str:
+    if 'bad' in url.path:
+        return '/status/400/'
+    elif url.path.endswith('.pem'):
+        return '/sns/certs/'
+    else:
+        return '/status/200/'
+
+
+# path rewrites used to route AWS urls to the dummy server, keyed on the service label of the host,
+# e.g. "s3" in "bucket.s3.region.amazonaws.com"
+url_rewrite_rules = {
+    's3': lambda url: f'/s3{url.path}',
+    'email': lambda url: '/ses/',
+    'sns': _sns_path,
+}
+
+
 class CustomAsyncClient(AsyncClient):
     def __init__(self, *args, local_server, **kwargs):
         super().__init__(*args, **kwargs)
         self.scheme, host_port = local_server.split('://')
         self.host, port = host_port.split(':')
         self.port = int(port)
+        self._local_paths: dict[tuple[str, str], str] = {}
 
     def _merge_url(self, url):
         if isinstance(url, str):
@@ -38,21 +61,19 @@ class CustomAsyncClient(AsyncClient):
                 return url
             url = URL(url)
 
-        new_url = url.copy_with(scheme=self.scheme, host=self.host, port=self.port)
-        if 's3.' in url.host:
-            return new_url.copy_with(path=f'/s3{new_url.path}')
-        elif 'email.' in url.host:
-            return new_url.copy_with(path='/ses/')
-        elif url.host.startswith('sns.'):
-            if 'bad' in url.path:
-                return new_url.copy_with(path='/status/400/')
-            elif url.path.endswith('.pem'):
-                return new_url.copy_with(path='/sns/certs/')
-            else:
-                return new_url.copy_with(path='/status/200/')
-        else:
-            # return url
+        key = url.host, url.path
+        path = self._local_paths.get(key)
+        if path is None:
+            path = self._local_paths[key] = self._local_path(url)
+        return url.copy_with(scheme=self.scheme, host=self.host, port=self.port, path=path)
+
+    @staticmethod
+    def _local_path(url):
+        labels = url.host.split('.')
+        rewrite_path = len(labels) >= 4 and url_rewrite_rules.get(labels[-4])
+        if not rewrite_path:
             raise ValueError(f'no local endpoint found for "{url}"')
+        return rewrite_path(url)
 
 
 @pytest.fixture(name='client')
@@ -61,6 +82,29 @@ async def _fix_client(loop, aws: DummyServer):
         yield client
 
 
+@pytest.fixture(name='s3')
+def _fix_s3(client: AsyncClient):
+    return S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+
+
+@pytest.fixture(name='ses')
+def _fix_ses(client: AsyncClient):
+    return SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+
+
+sqs_auth = AWSAuthConfig(
+    aws_access_key='test_access_key', aws_secret_key='test_secret_key', aws_region='testing-region-1'
+)
+
+
+@pytest.fixture(name='build_sqs_client')
+def _fix_build_sqs_client():
+    def build(queue_name_or_url: str, client: AsyncClient) -> SQSClient:
+        return SQSClient(queue_name_or_url=queue_name_or_url, auth=sqs_auth, client=client)
+
+    return build
+
+
 default_signature = base64.b64encode(b'testing').decode()
 
 
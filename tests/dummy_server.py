@@ -1,5 +1,7 @@
 import re
-from xml.etree import ElementTree
+from collections.abc import Sequence
+from functools import lru_cache
+from urllib.parse import parse_qsl
 
 from aiohttp import web
 from aiohttp.web_response import Response
@@ -26,55 +28,87 @@ s3_list_content_template = """\
     <StorageClass>STANDARD</StorageClass>
 </Contents>
 """
-xmlns = 'http://s3.amazonaws.com/doc/2006-03-01/'
-xmlns_re = re.compile(f' xmlns="{re.escape(xmlns)}"'.encode())
+# strip newlines and indentation once at import so every response body is as small as possible
+s3_list_response_template = re.sub(r'\n\s*', '', s3_list_response_template)
+s3_list_content_template = re.sub(r'\n\s*', '', s3_list_content_template)
+xml_error_body = s3_list_response_template.encode()
+# the content template has a single field, concatenating around it avoids a str.format call per file
+s3_list_content_prefix, s3_list_content_suffix = s3_list_content_template.split('{name}')
+delete_response_prefix = b'<?xml version="1.0" encoding="UTF-8"?><DeleteResult>'
+delete_response_suffix = b'</DeleteResult>'
+delete_key_re = re.compile(rb'<Key>([^<]*)</Key>')
 
 
 async def s3_root(request: web.Request):
     if request.url.query.get('delete') == '1':
         assert request.method == 'POST', request.method
         post_data = await request.read()
-        xml_root = ElementTree.fromstring(xmlns_re.sub(b'', post_data))
-        deleted = ''.join(f'<Deleted><Key>{k.find("Key").text}</Key></Deleted>' for k in xml_root)
-        body = f'<?xml version="1.0" encoding="UTF-8"?><DeleteResult>{deleted}</DeleteResult>'
-        return Response(body=body, content_type='text/xml')
+        # keys are echoed back still XML escaped, so there's no need to build a tree just to read them
+        deleted = [b'<Deleted><Key>' + k + b'</Key></Deleted>' for k in delete_key_re.findall(post_data)]
+        return Response(
+            body=b''.join([delete_response_prefix, *deleted, delete_response_suffix]), content_type='text/xml'
+        )
+
+    if request.method == 'POST':
+        # browser style upload with a signed policy, see S3Client.signed_upload_url
+        data = await request.post()
+        request.app['s3_files'][data['Key']] = data['file'].file.read()
+        return Response(status=204)
 
     assert request.method == 'GET', request.method
     prefix = request.url.query.get('prefix', '')
-    next_token: str = ''
-    truncated: bool = False
-    files: list[str]
     if prefix == 'broken':
-        files = ['/broken/foo.png', '/broken/bar.png']
-        truncated = True
+        body = s3_list_body(prefix, ('/broken/foo.png', '/broken/bar.png'), truncated=True)
     elif prefix == 'many':
-        if 'continuation-token' not in request.url.query:
-            files = [f'/many/f_{i}.txt' for i in range(1000)]
-            next_token = '<NextContinuationToken>foobar123</NextContinuationToken>'
-            truncated = True
-        else:
-            files = [f'/many/f_{i}.txt' for i in range(1000, 1500)]
+        body = many_page2_body if 'continuation-token' in request.url.query else many_page1_body
     else:
-        files = ['/foo.html', 'bar.html', '/spam.html']
+        body = default_list_body(prefix)
+    return Response(body=body, content_type='text/xml')
+
 
+def s3_list_body(prefix: str, files: Sequence[str], next_token: str = '', truncated: bool = False) -> bytes:
     body = s3_list_response_template.format(
         prefix=prefix,
         next_token=next_token,
         truncated=str(truncated).lower(),
         count=len(files),
-        content='\n'.join(s3_list_content_template.format(name=f) for f in files),
+        content=''.join([s3_list_content_prefix + f + s3_list_content_suffix for f in files]),
     )
-    return Response(body=body, content_type='text/xml')
+    return body.encode()
+
+
+@lru_cache
+def default_list_body(prefix: str) -> bytes:
+    return s3_list_body(prefix, ('/foo.html', 'bar.html', '/spam.html'))
+
+
+many_page1_files = tuple(f'/many/f_{i}.txt' for i in range(1000))
+many_page2_files = tuple(f'/many/f_{i}.txt' for i in range(1000, 1500))
+# list responses are deterministic, render the large "many" pages once rather than on every request
+many_page1_body = s3_list_body(
+    'many',
+    many_page1_files,
+    next_token='<NextContinuationToken>foobar123</NextContinuationToken>',
+    truncated=True,
+)
+many_page2_body = s3_list_body('many', many_page2_files)
+
+
+s3_file_body = b'this is demo file content'
 
 
 async def s3_file(request: web.Request):
-    return Response(body='this is demo file content')
+    return Response(body=s3_file_body)
+
+
+ses_send_body = ses_send_response('123-message-id', '123-request-id').encode()
 
 
 async def ses_send(request):
-    data = await request.post()
+    # SES requests are always urlencoded, parse the body directly rather than via aiohttp's multipart-aware post()
+    data = dict(parse_qsl((await request.read()).decode(), keep_blank_values=True))
     request.app['emails'].append(ses_email_data(data))
-    return Response(body=ses_send_response('123-message-id', '123-request-id'), content_type='text/xml')
+    return Response(body=ses_send_body, content_type='text/xml')
 
 
 aws_certs_body = (
@@ -112,12 +146,15 @@ aws_certs_body = (
 )
 
 
+aws_certs_bytes = aws_certs_body.encode()
+
+
 async def aws_certs(request):
-    return Response(body=aws_certs_body, content_type='content/unknown')
+    return Response(body=aws_certs_bytes, content_type='application/x-pem-file')
 
 
 async def xml_error(request):
-    return Response(body=s3_list_response_template, content_type='application/xml', status=456)
+    return Response(body=xml_error_body, content_type='application/xml', status=456)
 
 
 routes = [
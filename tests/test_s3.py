@@ -1,4 +1,6 @@
 import asyncio
+import base64
+import json
 import secrets
 from datetime import datetime, timezone
 
@@ -13,100 +15,102 @@ from aioaws.s3 import S3Client, S3Config, S3File, to_key
 from .conftest import AWS
 
 run_prefix = secrets.token_hex()[:10]
+# fixed "now" and expiry used by the signed upload url tests
+upload_now = datetime(2032, 1, 1)
+# expected signed upload fields, shared by the upload url tests
+upload_url_fields = {
+    'Key': 'testing/test.png',
+    'Content-Type': 'image/png',
+    'Content-Disposition': 'attachment; filename="test.png"',
+    'Policy': (
+        'eyJleHBpcmF0aW9uIjogIjIwMzItMDEtMDFUMDA6MDA6MDBaIiwgImNvbmRpdGlvbnMiOiBbeyJidWNrZXQiOiAidGVzdGluZy5jb'
+        '20ifSwgeyJrZXkiOiAidGVzdGluZy90ZXN0LnBuZyJ9LCB7ImNvbnRlbnQtdHlwZSI6ICJpbWFnZS9wbmcifSwgWyJjb250ZW50LW'
+        'xlbmd0aC1yYW5nZSIsIDEyMywgMTIzXSwgeyJDb250ZW50LURpc3Bvc2l0aW9uIjogImF0dGFjaG1lbnQ7IGZpbGVuYW1lPVwidGV'
+        'zdC5wbmdcIiJ9LCB7IngtYW16LWNyZWRlbnRpYWwiOiAidGVzdGluZy8yMDMyMDEwMS90ZXN0aW5nL3MzL2F3czRfcmVxdWVzdCJ9'
+        'LCB7IngtYW16LWFsZ29yaXRobSI6ICJBV1M0LUhNQUMtU0hBMjU2In0sIHsieC1hbXotZGF0ZSI6ICIyMDMyMDEwMVQwMDAwMDBaI'
+        'n1dfQ=='
+    ),
+    'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+    'X-Amz-Credential': 'testing/20320101/testing/s3/aws4_request',
+    'X-Amz-Date': '20320101T000000Z',
+    'X-Amz-Signature': '6f03af4c50aacb313ceb038743ca035bc2da2dc3bf9d1289f5cb946c6c940a60',
+}
+upload_url_no_content_disp_fields = {
+    'Key': 'testing/test.png',
+    'Content-Type': 'image/png',
+    'Policy': (
+        'eyJleHBpcmF0aW9uIjogIjIwMzItMDEtMDFUMDA6MDA6MDBaIiwgImNvbmRpdGlvbnMiOiBbeyJidWNrZXQiOiAidGVzdGluZy1id'
+        'WNrZXQifSwgeyJrZXkiOiAidGVzdGluZy90ZXN0LnBuZyJ9LCB7ImNvbnRlbnQtdHlwZSI6ICJpbWFnZS9wbmcifSwgWyJjb250ZW'
+        '50LWxlbmd0aC1yYW5nZSIsIDEyMywgMTIzXSwgeyJ4LWFtei1jcmVkZW50aWFsIjogInRlc3RpbmctYWNjZXNzLWtleS8yMDMyMDE'
+        'wMS90ZXN0aW5nLXJlZ2lvbi9zMy9hd3M0X3JlcXVlc3QifSwgeyJ4LWFtei1hbGdvcml0aG0iOiAiQVdTNC1ITUFDLVNIQTI1NiJ9'
+        'LCB7IngtYW16LWRhdGUiOiAiMjAzMjAxMDFUMDAwMDAwWiJ9XX0='
+    ),
+    'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+    'X-Amz-Credential': 'testing-access-key/20320101/testing-region/s3/aws4_request',
+    'X-Amz-Date': '20320101T000000Z',
+    'X-Amz-Signature': 'd1a0cd63d314f846291b9046ef0c253923ebff4af52bb3097558373ebf76bdb2',
+}
 
 
 def test_upload_url_after_overriding_aws_client_endpoint(mocker):
-    mocker.patch('aioaws.s3.utcnow', return_value=datetime(2032, 1, 1))
+    mocker.patch('aioaws.s3.utcnow', return_value=upload_now)
     s3 = S3Client('-', S3Config('testing', 'testing', 'testing', 'testing.com'))
     s3._aws_client.host = 'localhost:4766'
     s3._aws_client.schema = 'http'
     d = s3.signed_upload_url(
-        path='testing/', filename='test.png', content_type='image/png', size=123, expires=datetime(2032, 1, 1)
+        path='testing/', filename='test.png', content_type='image/png', size=123, expires=upload_now
     )
-    assert d == {
-        'url': 'http://localhost:4766/',
-        'fields': {
-            'Key': 'testing/test.png',
-            'Content-Type': 'image/png',
-            'Content-Disposition': 'attachment; filename="test.png"',
-            'Policy': (
-                'eyJleHBpcmF0aW9uIjogIjIwMzItMDEtMDFUMDA6MDA6MDBaIiwgImNvbmRpdGlvbnMiOiBbeyJidWNrZXQiOiAidGVzdGluZy5jb'
-                '20ifSwgeyJrZXkiOiAidGVzdGluZy90ZXN0LnBuZyJ9LCB7ImNvbnRlbnQtdHlwZSI6ICJpbWFnZS9wbmcifSwgWyJjb250ZW50LW'
-                'xlbmd0aC1yYW5nZSIsIDEyMywgMTIzXSwgeyJDb250ZW50LURpc3Bvc2l0aW9uIjogImF0dGFjaG1lbnQ7IGZpbGVuYW1lPVwidGV'
-                'zdC5wbmdcIiJ9LCB7IngtYW16LWNyZWRlbnRpYWwiOiAidGVzdGluZy8yMDMyMDEwMS90ZXN0aW5nL3MzL2F3czRfcmVxdWVzdCJ9'
-                'LCB7IngtYW16LWFsZ29yaXRobSI6ICJBV1M0LUhNQUMtU0hBMjU2In0sIHsieC1hbXotZGF0ZSI6ICIyMDMyMDEwMVQwMDAwMDBaI'
-                'n1dfQ=='
-            ),
-            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
-            'X-Amz-Credential': 'testing/20320101/testing/s3/aws4_request',
-            'X-Amz-Date': '20320101T000000Z',
-            'X-Amz-Signature': '6f03af4c50aacb313ceb038743ca035bc2da2dc3bf9d1289f5cb946c6c940a60',
-        },
-    }
-
-
-def test_upload_url(mocker):
-    mocker.patch('aioaws.s3.utcnow', return_value=datetime(2032, 1, 1))
-    s3 = S3Client('-', S3Config('testing', 'testing', 'testing', 'testing.com'))
-    d = s3.signed_upload_url(
-        path='testing/', filename='test.png', content_type='image/png', size=123, expires=datetime(2032, 1, 1)
-    )
-    assert d == {
-        'url': 'https://testing.com/',
-        'fields': {
-            'Key': 'testing/test.png',
-            'Content-Type': 'image/png',
-            'Content-Disposition': 'attachment; filename="test.png"',
-            'Policy': (
-                'eyJleHBpcmF0aW9uIjogIjIwMzItMDEtMDFUMDA6MDA6MDBaIiwgImNvbmRpdGlvbnMiOiBbeyJidWNrZXQiOiAidGVzdGluZy5jb'
-                '20ifSwgeyJrZXkiOiAidGVzdGluZy90ZXN0LnBuZyJ9LCB7ImNvbnRlbnQtdHlwZSI6ICJpbWFnZS9wbmcifSwgWyJjb250ZW50LW'
-                'xlbmd0aC1yYW5nZSIsIDEyMywgMTIzXSwgeyJDb250ZW50LURpc3Bvc2l0aW9uIjogImF0dGFjaG1lbnQ7IGZpbGVuYW1lPVwidGV'
-                'zdC5wbmdcIiJ9LCB7IngtYW16LWNyZWRlbnRpYWwiOiAidGVzdGluZy8yMDMyMDEwMS90ZXN0aW5nL3MzL2F3czRfcmVxdWVzdCJ9'
-                'LCB7IngtYW16LWFsZ29yaXRobSI6ICJBV1M0LUhNQUMtU0hBMjU2In0sIHsieC1hbXotZGF0ZSI6ICIyMDMyMDEwMVQwMDAwMDBaI'
-                'n1dfQ=='
-            ),
-            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
-            'X-Amz-Credential': 'testing/20320101/testing/s3/aws4_request',
-            'X-Amz-Date': '20320101T000000Z',
-            'X-Amz-Signature': '6f03af4c50aacb313ceb038743ca035bc2da2dc3bf9d1289f5cb946c6c940a60',
-        },
-    }
-
-
-def test_upload_url_no_content_disp(mocker):
-    mocker.patch('aioaws.s3.utcnow', return_value=datetime(2032, 1, 1))
-    s3 = S3Client('-', S3Config('testing-access-key', 'testing-secret-key', 'testing-region', 'testing-bucket'))
+    assert d == {'url': 'http://localhost:4766/', 'fields': upload_url_fields}
+
+
+@pytest.mark.parametrize(
+    'config,content_disp,expected',
+    [
+        (
+            S3Config('testing', 'testing', 'testing', 'testing.com'),
+            True,
+            {'url': 'https://testing.com/', 'fields': upload_url_fields},
+        ),
+        (
+            S3Config('testing-access-key', 'testing-secret-key', 'testing-region', 'testing-bucket'),
+            False,
+            {
+                'url': 'https://testing-bucket.s3.testing-region.amazonaws.com/',
+                'fields': upload_url_no_content_disp_fields,
+            },
+        ),
+    ],
+    ids=['content-disp', 'no-content-disp'],
+)
+def test_upload_url(mocker, config: S3Config, content_disp: bool, expected: dict):
+    mocker.patch('aioaws.s3.utcnow', return_value=upload_now)
+    s3 = S3Client('-', config)
     d = s3.signed_upload_url(
         path='testing/',
         filename='test.png',
         content_type='image/png',
         size=123,
-        content_disp=False,
-        expires=datetime(2032, 1, 1),
+        content_disp=content_disp,
+        expires=upload_now,
     )
-    assert d == {
-        'url': 'https://testing-bucket.s3.testing-region.amazonaws.com/',
-        'fields': {
-            'Key': 'testing/test.png',
-            'Content-Type': 'image/png',
-            'Policy': (
-                'eyJleHBpcmF0aW9uIjogIjIwMzItMDEtMDFUMDA6MDA6MDBaIiwgImNvbmRpdGlvbnMiOiBbeyJidWNrZXQiOiAidGVzdGluZy1id'
-                'WNrZXQifSwgeyJrZXkiOiAidGVzdGluZy90ZXN0LnBuZyJ9LCB7ImNvbnRlbnQtdHlwZSI6ICJpbWFnZS9wbmcifSwgWyJjb250ZW'
-                '50LWxlbmd0aC1yYW5nZSIsIDEyMywgMTIzXSwgeyJ4LWFtei1jcmVkZW50aWFsIjogInRlc3RpbmctYWNjZXNzLWtleS8yMDMyMDE'
-                'wMS90ZXN0aW5nLXJlZ2lvbi9zMy9hd3M0X3JlcXVlc3QifSwgeyJ4LWFtei1hbGdvcml0aG0iOiAiQVdTNC1ITUFDLVNIQTI1NiJ9'
-                'LCB7IngtYW16LWRhdGUiOiAiMjAzMjAxMDFUMDAwMDAwWiJ9XX0='
-            ),
-            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
-            'X-Amz-Credential': 'testing-access-key/20320101/testing-region/s3/aws4_request',
-            'X-Amz-Date': '20320101T000000Z',
-            'X-Amz-Signature': 'd1a0cd63d314f846291b9046ef0c253923ebff4af52bb3097558373ebf76bdb2',
-        },
-    }
+    assert d == expected
+
+
+def test_upload_url_fast_json(mocker):
+    pytest.importorskip('orjson')
+    mocker.patch('aioaws.s3.utcnow', return_value=upload_now)
+    s3 = S3Client('-', S3Config('testing', 'testing', 'testing', 'testing.com', fast_json=True))
+    d = s3.signed_upload_url(
+        path='testing/', filename='test.png', content_type='image/png', size=123, expires=upload_now
+    )
+    fields = d['fields']
+    # the policy is formatted differently so the signature changes, but the content of the policy is the same
+    assert fields['Policy'] != upload_url_fields['Policy']
+    assert json.loads(base64.b64decode(fields['Policy'])) == json.loads(base64.b64decode(upload_url_fields['Policy']))
+    assert fields['X-Amz-Signature'] != upload_url_fields['X-Amz-Signature']
 
 
-@pytest.mark.asyncio
-async def test_list(client: AsyncClient):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_list(s3: S3Client):
     files = [f async for f in s3.list()]
     assert len(files) == 3
     assert files[0].model_dump() == dict(
@@ -118,9 +122,7 @@ async def test_list(client: AsyncClient):
     )
 
 
-@pytest.mark.asyncio
-async def test_list_delete_many(client: AsyncClient, aws: DummyServer):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_list_delete_many(s3: S3Client, aws: DummyServer):
     files = [f async for f in s3.list('many')]
     assert len(files) == 1500
     deleted_files = await s3.delete_recursive('many')
@@ -135,33 +137,76 @@ async def test_list_delete_many(client: AsyncClient, aws: DummyServer):
     ]
 
 
-@pytest.mark.asyncio
-async def test_download_ok(client: AsyncClient, aws: DummyServer):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_upload_many(s3: S3Client, aws: DummyServer):
+    await s3.upload_many(((f'many/f_{i}.txt', f'file {i}'.encode()) for i in range(20)), concurrency=4)
+    assert aws.app['s3_files'] == {f'many/f_{i}.txt': f'file {i}'.encode() for i in range(20)}
+    assert aws.log == ['POST /s3/ > 204'] * 20
+
+
+async def test_upload_many_lazy(mocker):
+    s3 = S3Client('-', S3Config('testing', 'testing', 'testing', 'testing.com'))
+    consumed = 0
+    consumed_at_upload = []
+
+    def files():
+        nonlocal consumed
+        for i in range(10):
+            consumed += 1
+            yield f'f_{i}.txt', b'x'
+
+    async def upload(self, file_path, content):
+        consumed_at_upload.append(consumed)
+
+    mocker.patch.object(S3Client, 'upload', upload)
+    await s3.upload_many(files(), concurrency=2)
+    # the generator is only advanced when a worker is ready for the next file
+    assert consumed_at_upload == list(range(1, 11))
+
+
+async def test_upload_many_error(mocker):
+    s3 = S3Client('-', S3Config('testing', 'testing', 'testing', 'testing.com'))
+    started = []
+
+    async def upload(self, file_path, content):
+        started.append(file_path)
+        await asyncio.sleep(0)
+        if file_path == 'f_5.txt':
+            raise ValueError('upload failed')
+
+    mocker.patch.object(S3Client, 'upload', upload)
+    with pytest.raises(ValueError, match='upload failed'):
+        await s3.upload_many(((f'f_{i}.txt', b'x') for i in range(100)), concurrency=4)
+    started_at_error = len(started)
+    assert started_at_error < 100
+    await asyncio.sleep(0.01)
+    # the remaining workers are cancelled so no more uploads start after the error
+    assert len(started) == started_at_error
+
+
+async def test_delete_escaped_key(s3: S3Client, aws: DummyServer):
+    assert await s3.delete('foo.txt', 'a&b <c>.txt') == ['foo.txt', 'a&b <c>.txt']
+    assert aws.log == ['POST /s3/?delete=1 > 200']
+
+
+async def test_download_ok(s3: S3Client, aws: DummyServer):
     content = await s3.download('testing.txt')
     assert content == b'this is demo file content'
     assert aws.log == [IsStr(regex=r'GET /s3/testing\.txt\?.+ > 200')]
 
 
-@pytest.mark.asyncio
-async def test_download_ok_file(client: AsyncClient, aws: DummyServer):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_download_ok_file(s3: S3Client, aws: DummyServer):
     content = await s3.download(S3File(Key='testing.txt', LastModified=0, Size=1, ETag='x', StorageClass='x'))
     assert content == b'this is demo file content'
     assert aws.log == [IsStr(regex=r'GET /s3/testing\.txt\?.+ > 200')]
 
 
-@pytest.mark.asyncio
-async def test_download_error(client: AsyncClient, aws: DummyServer):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_download_error(s3: S3Client, aws: DummyServer):
     with pytest.raises(RequestError):
         await s3.download('missing.txt')
     assert aws.log == [IsStr(regex=r'GET /s3/missing\.txt\?.+ > 404')]
 
 
-@pytest.mark.asyncio
-async def test_list_bad(client: AsyncClient):
-    s3 = S3Client(client, S3Config('testing', 'testing', 'testing', 'testing'))
+async def test_list_bad(s3: S3Client):
     with pytest.raises(RuntimeError, match='unexpected response from S3'):
         async for _ in s3.list('broken'):
             pass
@@ -170,6 +215,11 @@ async def test_list_bad(client: AsyncClient):
 def test_to_key():
     assert to_key('foobar') == 'foobar'
     assert to_key(S3File.model_construct(key='spam')) == 'spam'
+
+    class StrSubclass(str):
+        pass
+
+    assert to_key(StrSubclass('foobar')) == 'foobar'
     with pytest.raises(TypeError, match='must be a string or S3File object'):
         to_key(123)
 
@@ -221,7 +271,7 @@ def test_aws4_upload_signature(client: AsyncClient, mocker):
     }
 
 
-@pytest.mark.asyncio
+@pytest.mark.slow
 async def test_real_upload(real_aws: AWS):
     async with AsyncClient(timeout=30) as client:
         s3 = S3Client(client, S3Config(real_aws.access_key, real_aws.secret_key, 'us-east-1', 'aioaws-testing'))
@@ -245,7 +295,7 @@ async def test_real_upload(real_aws: AWS):
             assert [f.model_dump() async for f in s3.list(f'{run_prefix}/')] == []
 
 
-@pytest.mark.asyncio
+@pytest.mark.slow
 async def test_real_download_link(real_aws: AWS):
     async with AsyncClient(timeout=30) as client:
         s3 = S3Client(client, S3Config(real_aws.access_key, real_aws.secret_key, 'us-east-1', 'aioaws-testing'))
@@ -263,19 +313,19 @@ async def test_real_download_link(real_aws: AWS):
             await s3.delete(f'{run_prefix}/foobar.txt')
 
 
-@pytest.mark.asyncio
+@pytest.mark.slow
 async def test_real_many(real_aws: AWS):
     async with AsyncClient(timeout=30) as client:
         s3 = S3Client(client, S3Config(real_aws.access_key, real_aws.secret_key, 'us-east-1', 'aioaws-testing'))
 
         # upload many files
-        await asyncio.gather(*[s3.upload(f'{run_prefix}/f_{i}.txt', f'file {i}'.encode()) for i in range(51)])
+        await s3.upload_many((f'{run_prefix}/f_{i}.txt', f'file {i}'.encode()) for i in range(51))
 
         deleted_files = await s3.delete_recursive(f'{run_prefix}/')
         assert len(deleted_files) == 51
 
 
-@pytest.mark.asyncio
+@pytest.mark.slow
 async def test_bad_auth():
     async with AsyncClient(timeout=30) as client:
         s3 = S3Client(client, S3Config('BAD_access_key', 'BAD_secret_key', 'us-west-2', 'foobar'))
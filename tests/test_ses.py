@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 import re
@@ -10,15 +11,63 @@ from httpx import AsyncClient
 
 from aioaws.ses import SesAttachment, SesClient, SesConfig, SesRecipient, SesWebhookInfo
 from aioaws.sns import SnsWebhookError
-
-from .conftest import AWS
-
-pytestmark = pytest.mark.asyncio
-
-
-async def test_send(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
-
+from aioaws.testing import ses_email_data
+
+from .conftest import AWS, default_signature
+
+# attachments shared between tests, none of the tests modify them
+txt_attachment = SesAttachment(file=b'some binary data', name='testing.txt', mime_type='text/plain')
+pdf_attachment = SesAttachment(file=b'some attachment', name='testing.txt', mime_type='application/pdf')
+inline_attachment = SesAttachment(file=b'some attachment', name='foobar.txt', content_id='<testing-content-id>')
+# expected raw MIME of the attachment emails, the boundaries are random so are matched and back-referenced
+attachment_raw_email_re = re.compile(
+    rb'Subject: test with attachment =\?utf-8\?b\?wqPCo8Kj\?= more\n'
+    rb'From: testing@sender\.com\n'
+    rb'To: testing@recipient\.com\n'
+    rb'MIME-Version: 1\.0\n'
+    rb'Content-Type: multipart/mixed; boundary="===============(\d+)=="\n\n'
+    rb'--===============\1==\n'
+    rb'Content-Type: text/plain; charset="utf-8"\n'
+    rb'Content-Transfer-Encoding: 7bit\n\n'
+    rb'this is a test email\n\n'
+    rb'--===============(\d+)==\n'
+    rb'Content-Type: text/plain\n'
+    rb'MIME-Version: 1\.0\n'
+    rb'Content-Transfer-Encoding: base64\n'
+    rb'Content-Disposition: attachment; filename="testing\.txt"\n\n'
+    rb'c29tZSBiaW5hcnkgZGF0YQ==\n\n'
+    rb'--===============\2==--\n'
+)
+attachment_html_raw_email_re = re.compile(
+    rb'Subject: the subject\n'
+    rb'From: testing@sender\.com\n'
+    rb'To: testing@recipient\.com\n'
+    rb'MIME-Version: 1\.0\n'
+    rb'Content-Type: multipart/mixed; boundary="===============(\d+)=="\n\n'
+    rb'--===============\1==\n'
+    rb'Content-Type: multipart/alternative;\n'
+    rb' boundary="===============(\d+)=="\n\n'
+    rb'--===============\2==\n'
+    rb'Content-Type: text/plain; charset="utf-8"\n'
+    rb'Content-Transfer-Encoding: 7bit\n\n'
+    rb'this is a test email\n\n'
+    rb'--===============\2==\n'
+    rb'Content-Type: text/html; charset="utf-8"\n'
+    rb'Content-Transfer-Encoding: 7bit\n'
+    rb'MIME-Version: 1\.0\n\n'
+    rb'this is the <b>html body</b>\.\n\n'
+    rb'--===============\2==--\n\n'
+    rb'--===============\1==\n'
+    rb'Content-Type: text/plain\n'
+    rb'MIME-Version: 1\.0\n'
+    rb'Content-Transfer-Encoding: base64\n'
+    rb'Content-Disposition: attachment; filename="testing\.txt"\n\n'
+    rb'c29tZSBhdHRhY2htZW50\n\n'
+    rb'--===============\1==--\n'
+)
+
+
+async def test_send(ses: SesClient, aws: DummyServer):
     message_id = await ses.send_email(
         'testing@sender.com',
         'test email',
@@ -48,15 +97,39 @@ async def test_send(client: AsyncClient, aws: DummyServer):
     }
 
 
-async def test_send_email_attachment(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+async def test_send_long_unicode_subject(ses: SesClient, aws: DummyServer):
+    subject = (
+        'a long subject with £££ in it and enough other words in the middle that it gets folded over several lines'
+    )
+    await ses.send_email('testing@sender.com', subject, ['testing@recipient.com'], 'this is a test email')
+    raw_body = base64.b64decode(aws.app['emails'][0]['body']['RawMessage.Data'])
+    # check the header really was folded
+    assert b'\n ' in raw_body.split(b'\nFrom: ')[0]
+    assert aws.app['emails'][0]['email']['Subject'] == subject
+
 
+async def test_send_unicode_body(ses: SesClient, aws: DummyServer):
+    await ses.send_email(
+        'testing@sender.com', 'test email', ['testing@recipient.com'], 'this is £££ text', html_body='<b>£££</b>'
+    )
+    raw_body = base64.b64decode(aws.app['emails'][0]['body']['RawMessage.Data'])
+    # SES recommends non 7bit content is encoded
+    assert raw_body.count(b'Content-Transfer-Encoding: base64') == 2
+    assert b'8bit' not in raw_body
+    assert raw_body.isascii()
+    assert aws.app['emails'][0]['email']['payload'] == [
+        {'Content-Type': 'text/plain', 'payload': 'this is £££ text\n'},
+        {'Content-Type': 'text/html', 'payload': '<b>£££</b>\n'},
+    ]
+
+
+async def test_send_email_attachment(ses: SesClient, aws: DummyServer):
     await ses.send_email(
         'testing@sender.com',
         'test with attachment £££ more',
         ['testing@recipient.com'],
         'this is a test email',
-        attachments=[SesAttachment(file=b'some binary data', name='testing.txt', mime_type='text/plain')],
+        attachments=[txt_attachment],
     )
     assert len(aws.app['emails']) == 1
     eml = aws.app['emails'][0]
@@ -74,34 +147,29 @@ async def test_send_email_attachment(client: AsyncClient, aws: DummyServer):
             },
         ],
     }
-    raw_body = base64.b64decode(eml['body']['RawMessage.Data'].encode())
+    raw_body = base64.b64decode(eml['body']['RawMessage.Data'])
+
+    assert attachment_raw_email_re.fullmatch(raw_body)
 
-    assert re.fullmatch(
-        (
-            rb'Subject: test with attachment =\?utf-8\?b\?wqPCo8Kj\?= more\n'
-            rb'From: testing@sender\.com\n'
-            rb'To: testing@recipient\.com\n'
-            rb'MIME-Version: 1\.0\n'
-            rb'Content-Type: multipart/mixed; boundary="===============(\d+)=="\n\n'
-            rb'--===============\1==\n'
-            rb'Content-Type: text/plain; charset="utf-8"\n'
-            rb'Content-Transfer-Encoding: 7bit\n\n'
-            rb'this is a test email\n\n'
-            rb'--===============(\d+)==\n'
-            rb'Content-Type: text/plain\n'
-            rb'MIME-Version: 1\.0\n'
-            rb'Content-Transfer-Encoding: base64\n'
-            rb'Content-Disposition: attachment; filename="testing\.txt"\n\n'
-            rb'c29tZSBiaW5hcnkgZGF0YQ==\n\n'
-            rb'--===============\2==--\n'
-        ),
-        raw_body,
-    )
 
+async def test_send_email_large_attachment(ses: SesClient, aws: DummyServer, mocker):
+    to_thread = mocker.spy(asyncio, 'to_thread')
+
+    data = b'x' * 300_000
+    await ses.send_email(
+        'testing@sender.com',
+        'test with large attachment',
+        ['testing@recipient.com'],
+        'this is a test email',
+        attachments=[SesAttachment(file=data, name='testing.txt', mime_type='text/plain')],
+    )
+    # the request body is big enough to be hashed in a thread
+    assert to_thread.call_count == 1
+    assert aws.log == ['POST /ses/ > 200']
+    assert aws.app['emails'][0]['email']['payload'][-1]['payload'] == data.decode()
 
-async def test_attachment_path(client: AsyncClient, aws: DummyServer, tmp_path):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
 
+async def test_attachment_path(ses: SesClient, aws: DummyServer, tmp_path):
     p = tmp_path / 'testing.txt'
     p.write_text('hello')
 
@@ -131,9 +199,7 @@ async def test_attachment_path(client: AsyncClient, aws: DummyServer, tmp_path):
     }
 
 
-async def test_send_names(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
-
+async def test_send_names(ses: SesClient, aws: DummyServer):
     await ses.send_email(
         'testing@sender.com',
         'test email',
@@ -172,56 +238,40 @@ async def test_send_names(client: AsyncClient, aws: DummyServer):
     }
 
 
-async def test_attachment_email_with_html(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+def test_recipient_mutable():
+    r = SesRecipient('testing@example.com', 'John')
+    r.last_name = 'Doe'
+    assert r.display() == 'John Doe <testing@example.com>'
 
+
+async def test_attachment_email_with_html(ses: SesClient, aws: DummyServer):
     await ses.send_email(
         'testing@sender.com',
         'the subject',
         ['testing@recipient.com'],
         'this is a test email',
         html_body='this is the <b>html body</b>.',
-        attachments=[SesAttachment(file=b'some attachment', name='testing.txt', mime_type='application/pdf')],
+        attachments=[pdf_attachment],
     )
     assert len(aws.app['emails']) == 1
     eml = aws.app['emails'][0]
     assert eml['email']['Subject'] == 'the subject'
-    raw_body = base64.b64decode(eml['body']['RawMessage.Data'].encode())
-    assert re.fullmatch(
-        (
-            rb'Subject: the subject\n'
-            rb'From: testing@sender\.com\n'
-            rb'To: testing@recipient\.com\n'
-            rb'MIME-Version: 1\.0\n'
-            rb'Content-Type: multipart/mixed; boundary="===============(\d+)=="\n\n'
-            rb'--===============\1==\n'
-            rb'Content-Type: multipart/alternative;\n'
-            rb' boundary="===============(\d+)=="\n\n'
-            rb'--===============\2==\n'
-            rb'Content-Type: text/plain; charset="utf-8"\n'
-            rb'Content-Transfer-Encoding: 7bit\n\n'
-            rb'this is a test email\n\n'
-            rb'--===============\2==\n'
-            rb'Content-Type: text/html; charset="utf-8"\n'
-            rb'Content-Transfer-Encoding: 7bit\n'
-            rb'MIME-Version: 1\.0\n\n'
-            rb'this is the <b>html body</b>\.\n\n'
-            rb'--===============\2==--\n\n'
-            rb'--===============\1==\n'
-            rb'Content-Type: text/plain\n'
-            rb'MIME-Version: 1\.0\n'
-            rb'Content-Transfer-Encoding: base64\n'
-            rb'Content-Disposition: attachment; filename="testing\.txt"\n\n'
-            rb'c29tZSBhdHRhY2htZW50\n\n'
-            rb'--===============\1==--\n'
-        ),
-        raw_body,
-    )
+    raw_body = base64.b64decode(eml['body']['RawMessage.Data'])
+    assert attachment_html_raw_email_re.fullmatch(raw_body)
 
 
-async def test_custom_headers(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+def test_ses_email_data_repeated_header():
+    raw = b'Subject: =?utf-8?b?wqPCo8Kj?=\nX-Tag: first\nX-Tag: second\nContent-Type: text/plain\n\nhello\n'
+    eml = ses_email_data({'RawMessage.Data': base64.b64encode(raw).decode()})
+    # the last value of a repeated header wins
+    assert eml['email'] == {
+        'Subject': '£££',
+        'X-Tag': 'second',
+        'payload': [{'Content-Type': 'text/plain', 'payload': 'hello\n'}],
+    }
+
 
+async def test_custom_headers(ses: SesClient, aws: DummyServer):
     await ses.send_email(
         'testing@sender.com',
         'test email',
@@ -248,16 +298,14 @@ async def test_custom_headers(client: AsyncClient, aws: DummyServer):
     }
 
 
-async def test_inline_attachment(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
-
+async def test_inline_attachment(ses: SesClient, aws: DummyServer):
     await ses.send_email(
         'testing@sender.com',
         'the subject',
         ['testing@recipient.com'],
         'this is a test email',
         html_body='this is the <b>html body</b>.',
-        attachments=[SesAttachment(file=b'some attachment', name='foobar.txt', content_id='<testing-content-id>')],
+        attachments=[inline_attachment],
     )
     assert len(aws.app['emails']) == 1
     assert aws.app['emails'][0]['email']['payload'] == [
@@ -278,8 +326,7 @@ async def test_inline_attachment(client: AsyncClient, aws: DummyServer):
     ]
 
 
-async def test_encoded_unsub(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+async def test_encoded_unsub(ses: SesClient, aws: DummyServer):
     unsub_link = 'https://www.example.com/unsubscrible?blob=?blob=$MzMgMTYwMTY3MDEyOCBMMzcbN_nhcDZNg-6D=='
     await ses.send_email(
         'testing@sender.com',
@@ -292,45 +339,47 @@ async def test_encoded_unsub(client: AsyncClient, aws: DummyServer):
     assert email['List-Unsubscribe'] == f'<{unsub_link}>'
 
 
-async def test_no_recipients(client: AsyncClient, aws: DummyServer):
-    ses = SesClient(client, SesConfig('test_access_key', 'test_secret_key', 'testing-region-1'))
+async def test_no_recipients(ses: SesClient, aws: DummyServer):
     with pytest.raises(TypeError, match='either "to", "cc", or "bcc" must be provided'):
         await ses.send_email('testing@sender.com', 'test email', None, 'xx')
 
     assert aws.log == []
 
 
-async def test_webhook_open(client: AsyncClient, build_sns_webhook):
-    message = {'eventType': 'Open', 'mail': {'messageId': 'testing-123'}, 'open': {'ipAddress': '1.2.3.4'}}
-    info = await SesWebhookInfo.build(build_sns_webhook(message), client)
+@pytest.mark.parametrize(
+    'message,expected',
+    [
+        (
+            {'eventType': 'Open', 'mail': {'messageId': 'testing-123'}, 'open': {'ipAddress': '1.2.3.4'}},
+            {'event_type': 'open', 'timestamp': None, 'unsubscribe': False, 'details': {'ipAddress': '1.2.3.4'}},
+        ),
+        (
+            {
+                'eventType': 'Bounce',
+                'mail': {'messageId': 'testing-123', 'tags': {'ses:operation': ['SendRawEmail']}},
+                'bounce': {'bounceType': 'other'},
+            },
+            {
+                'event_type': 'bounce',
+                'unsubscribe': False,
+                'details': {'bounceType': 'other'},
+                'tags': {'ses:operation': 'SendRawEmail'},
+            },
+        ),
+        (
+            {'eventType': 'Complaint', 'mail': {'messageId': 'testing-123'}},
+            {'event_type': 'complaint', 'unsubscribe': True},
+        ),
+    ],
+    ids=['open', 'bounce', 'complaint'],
+)
+@pytest.mark.parametrize('as_bytes', [False, True], ids=['str', 'bytes'])
+async def test_webhook_event(client: AsyncClient, build_sns_webhook, message, expected, as_bytes):
+    body = build_sns_webhook(message)
+    info = await SesWebhookInfo.build(body.encode() if as_bytes else body, client)
     assert info.message_id == 'testing-123'
-    assert info.event_type == 'open'
-    assert info.timestamp is None
-    assert info.unsubscribe is False
-    assert info.details == {'ipAddress': '1.2.3.4'}
     assert info.full_message == message
-
-
-async def test_webhook_bounce(client: AsyncClient, build_sns_webhook):
-    message = {
-        'eventType': 'Bounce',
-        'mail': {'messageId': 'testing-123', 'tags': {'ses:operation': ['SendRawEmail']}},
-        'bounce': {'bounceType': 'other'},
-    }
-    info = await SesWebhookInfo.build(build_sns_webhook(message).encode(), client)
-    assert info.message_id == 'testing-123'
-    assert info.event_type == 'bounce'
-    assert info.unsubscribe is False
-    assert info.details == {'bounceType': 'other'}
-    assert info.tags == {'ses:operation': 'SendRawEmail'}
-
-
-async def test_webhook_complaint(client: AsyncClient, build_sns_webhook):
-    message = {'eventType': 'Complaint', 'mail': {'messageId': 'testing-123'}}
-    info = await SesWebhookInfo.build(build_sns_webhook(message), client)
-    assert info.message_id == 'testing-123'
-    assert info.event_type == 'complaint'
-    assert info.unsubscribe is True
+    assert {k: getattr(info, k) for k in expected} == expected
 
 
 async def test_webhook_ts(client: AsyncClient, build_sns_webhook):
@@ -343,7 +392,7 @@ async def test_webhook_bad_auth(client: AsyncClient):
     d = {
         'Type': 'Notification',
         'SigningCertURL': 'https://sns.eu-west-2.amazonaws.com/SimpleNotificationService-123.pem',
-        'Signature': base64.b64encode(b'testing').decode(),
+        'Signature': default_signature,
         'Message': '{}',
     }
     with pytest.raises(SnsWebhookError, match='invalid signature'):
@@ -355,24 +404,19 @@ async def test_webhook_no_json(client: AsyncClient, build_sns_webhook):
     assert info is None
 
 
-async def test_webhook_bad_signing_url(client: AsyncClient, build_sns_webhook):
-    with pytest.raises(SnsWebhookError, match='invalid SigningCertURL "http://www.example.com/testing"'):
-        await SesWebhookInfo.build(build_sns_webhook({}, sig_url='http://www.example.com/testing'), client)
-
-
-async def test_webhook_bad_response(client: AsyncClient, build_sns_webhook):
-    with pytest.raises(SnsWebhookError, match='unexpected response from'):
-        await SesWebhookInfo.build(build_sns_webhook({}, sig_url='https://sns.eu-west-2.amazonaws.com/bad.pem'), client)
-
-
-async def test_webhook_invalid_payload(client: AsyncClient, build_sns_webhook):
-    with pytest.raises(SnsWebhookError, match='invalid payload'):
-        await SesWebhookInfo.build(build_sns_webhook({}, event_type='foobar'), client)
-
-
-async def test_webhook_invalid_signature_base64(client: AsyncClient, build_sns_webhook):
-    with pytest.raises(SnsWebhookError, match='invalid payload'):
-        await SesWebhookInfo.build(build_sns_webhook({}, signature='testing'), client)
+@pytest.mark.parametrize(
+    'kwargs,error',
+    [
+        ({'sig_url': 'http://www.example.com/testing'}, 'invalid SigningCertURL "http://www.example.com/testing"'),
+        ({'sig_url': 'https://sns.eu-west-2.amazonaws.com/bad.pem'}, 'unexpected response from'),
+        ({'event_type': 'foobar'}, 'invalid payload'),
+        ({'signature': 'testing'}, 'invalid payload'),
+    ],
+    ids=['bad-signing-url', 'bad-response', 'invalid-payload', 'invalid-signature-base64'],
+)
+async def test_webhook_error(client: AsyncClient, build_sns_webhook, kwargs, error):
+    with pytest.raises(SnsWebhookError, match=error):
+        await SesWebhookInfo.build(build_sns_webhook({}, **kwargs), client)
 
 
 async def test_webhook_subscribe(client: AsyncClient, aws: DummyServer, mocker):
@@ -380,7 +424,7 @@ async def test_webhook_subscribe(client: AsyncClient, aws: DummyServer, mocker):
     d = {
         'Type': 'SubscriptionConfirmation',
         'SigningCertURL': 'https://sns.eu-west-2.amazonaws.com/SimpleNotificationService-123.pem',
-        'Signature': base64.b64encode(b'testing').decode(),
+        'Signature': default_signature,
         'SubscribeURL': 'https://sns.eu-west-2.amazonaws.com/?Action=1234',
     }
     info = await SesWebhookInfo.build(json.dumps(d), client)
@@ -388,6 +432,7 @@ async def test_webhook_subscribe(client: AsyncClient, aws: DummyServer, mocker):
     assert aws.log == ['GET /sns/certs/ > 200', 'GET /status/200/?Action=1234 > 200']
 
 
+@pytest.mark.slow
 async def test_real_send(real_aws: AWS):
     async with AsyncClient() as client:
         ses = SesClient(client, SesConfig(real_aws.access_key, real_aws.secret_key, 'eu-west-1'))
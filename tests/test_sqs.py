@@ -1,61 +1,76 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import hmac
+from collections.abc import Iterable, Sequence
+from typing import Any
 
 import pytest
-from httpx import AsyncClient, MockTransport, Request, Response
-
-from aioaws.sqs import AWSAuthConfig, SQSClient, SQSMessage
-
-pytestmark = pytest.mark.asyncio
-
-
-async def test_poll_from_queue_url() -> None:
-    async def stateful_handler() -> AsyncGenerator[Response | None, Request]:
-        req = yield None
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        expected_params = {'Action': 'ReceiveMessage', 'MaxNumberOfMessages': '1', 'WaitTimeSeconds': '10'}
-        for param, expected_val in expected_params.items():
-            assert req.url.params[param] == expected_val
+from httpx import AsyncClient, HTTPStatusError, Limits, MockTransport, Request, Response
+
+from aioaws import core
+from aioaws.sqs import PollConfig, SQSMessage, create_sqs_client
+
+from .conftest import sqs_auth
+
+queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/MyQueue'
+receive_message_json = {
+    'ReceiveMessageResponse': {
+        'ReceiveMessageResult': {
+            'messages': [
+                {
+                    'MessageId': 'message-id-1234',
+                    'ReceiptHandle': 'receipt_handle',
+                    'MD5OfBody': 'body-md5-123',
+                    'Body': 'foo bar',
+                    'Attributes': {},
+                }
+            ]
+        }
+    }
+}
+expected_auth_headers = {'x-amz-date', 'authorization', 'x-amz-content-sha256'}
+# (expected url without query, expected query params, response json) for each request in order
+Step = tuple[str, dict[str, str], Any]
+
+
+class SequencedMockTransport(MockTransport):
+    """
+    Check each request against the next expected step and respond with that step's json.
+    """
+
+    def __init__(self, steps: Sequence[Step]) -> None:
+        super().__init__(self.handle)
+        self.steps = steps
+        self.requests: list[Request] = []
+
+    def handle(self, req: Request) -> Response:
+        assert len(self.requests) < len(self.steps), f'unexpected request {req.url}'
+        expected_url, expected_params, response_json = self.steps[len(self.requests)]
+        self.requests.append(req)
+        # compare the url string up to the query rather than building a new URL without params
+        assert str(req.url).partition('?')[0] == expected_url
+        assert expected_params.items() <= dict(req.url.params).items()
         assert req.headers['Accept'] == 'application/json'
         # not checking auth header values, tested elsewhere
-        expected_auth_headers = {'x-amz-date', 'authorization', 'x-amz-content-sha256'}
-        for header in expected_auth_headers:
-            assert header in req.headers
-        req = yield Response(
-            status_code=200,
-            json={
-                'ReceiveMessageResponse': {
-                    'ReceiveMessageResult': {
-                        'messages': [
-                            {
-                                'MessageId': 'message-id-1234',
-                                'ReceiptHandle': 'receipt_handle',
-                                'MD5OfBody': 'body-md5-123',
-                                'Body': 'foo bar',
-                                'Attributes': {},
-                            }
-                        ]
-                    }
-                }
-            },
-        )
-
-    handler = stateful_handler()
-    await handler.__anext__()  # prime the generator
-
-    client = AsyncClient(transport=MockTransport(handler.asend))
-
-    queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/MyQueue'
-
-    sqs = SQSClient(
-        queue_name_or_url=queue_url,
-        auth=AWSAuthConfig(
-            aws_access_key='test_access_key',
-            aws_secret_key='test_secret_key',
-            aws_region='testing-region-1',
-        ),
-        client=client,
+        assert expected_auth_headers <= req.headers.keys()
+        return Response(status_code=200, json=response_json)
+
+    def assert_all_called(self) -> None:
+        assert len(self.requests) == len(self.steps), 'Missing API calls'
+
+
+async def test_poll_from_queue_url(build_sqs_client) -> None:
+    transport = SequencedMockTransport(
+        [
+            (
+                queue_url,
+                {'Action': 'ReceiveMessage', 'MaxNumberOfMessages': '10', 'WaitTimeSeconds': '20'},
+                receive_message_json,
+            ),
+        ]
     )
+    client = AsyncClient(transport=transport)
+
+    sqs = build_sqs_client(queue_url, client)
 
     messages: list[SQSMessage] = []
 
@@ -76,64 +91,40 @@ async def test_poll_from_queue_url() -> None:
     assert messages == expected_messages
 
 
-async def test_change_visbility_timeout() -> None:
-    async def stateful_handler() -> AsyncGenerator[Response | None, Request]:
-        req = yield None
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        # receiving messages is tested elewhere, we just do a basic check here
-        assert req.url.params['Action'] == 'ReceiveMessage'
-        req = yield Response(
-            status_code=200,
-            json={
-                'ReceiveMessageResponse': {
-                    'ReceiveMessageResult': {
-                        'messages': [
-                            {
-                                'MessageId': 'message-id-1234',
-                                'ReceiptHandle': 'receipt_handle',
-                                'MD5OfBody': 'body-md5-123',
-                                'Body': 'foo bar',
-                                'Attributes': {},
-                            }
-                        ]
-                    }
-                }
-            },
-        )
-        # now we should get a request to change the visibility timeout
-        assert request_url == queue_url
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        expected_params = {'Action': 'ChangeMessageVisibility', 'VisibilityTimeout': '1'}
-        for param, expected_val in expected_params.items():
-            assert req.url.params[param] == expected_val
-        assert req.headers['Accept'] == 'application/json'
-        # not checking auth header values, tested elsewhere
-        expected_auth_headers = {'x-amz-date', 'authorization', 'x-amz-content-sha256'}
-        for header in expected_auth_headers:
-            assert header in req.headers
-        req = yield Response(
-            status_code=200,
-            json={},  # we don't exepct any particular response
-        )
+async def test_poll_short_polling(build_sqs_client) -> None:
+    transport = SequencedMockTransport(
+        [
+            (
+                queue_url,
+                {'Action': 'ReceiveMessage', 'MaxNumberOfMessages': '1', 'WaitTimeSeconds': '0'},
+                receive_message_json,
+            ),
+        ]
+    )
+    client = AsyncClient(transport=transport)
 
-    handler = stateful_handler()
-    await handler.__anext__()  # prime the generator
+    sqs = build_sqs_client(queue_url, client)
 
-    client = AsyncClient(transport=MockTransport(handler.asend))
+    async for received_messages in sqs.poll(config=PollConfig(wait_time=0, max_messages=1)):
+        assert len(list(received_messages)) == 1
+        break
+
+    # the read timeout never drops below httpx's default even when not long polling
+    assert [r.extensions['timeout'] for r in transport.requests] == [{'connect': 5, 'read': 5, 'write': 5, 'pool': 5}]
 
-    queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/MyQueue'
 
-    sqs = SQSClient(
-        queue_name_or_url=queue_url,
-        auth=AWSAuthConfig(
-            aws_access_key='test_access_key',
-            aws_secret_key='test_secret_key',
-            aws_region='testing-region-1',
-        ),
-        client=client,
+async def test_change_visbility_timeout(build_sqs_client) -> None:
+    transport = SequencedMockTransport(
+        [
+            # receiving messages is tested elsewhere, we just do a basic check here
+            (queue_url, {'Action': 'ReceiveMessage'}, receive_message_json),
+            # we don't expect any particular response
+            (queue_url, {'Action': 'ChangeMessageVisibility', 'VisibilityTimeout': '1'}, {}),
+        ]
     )
+    client = AsyncClient(transport=transport)
+
+    sqs = build_sqs_client(queue_url, client)
 
     # receive 1 batch of messages
     async for received_messages in sqs.poll():
@@ -141,72 +132,21 @@ async def test_change_visbility_timeout() -> None:
             await sqs.change_visibility(message, 1)
         break
 
-    try:
-        await handler.__anext__()
-    except StopAsyncIteration:
-        pass
-    else:
-        raise AssertionError('Missing API calls')
-
-
-async def test_delete_message() -> None:
-    async def stateful_handler() -> AsyncGenerator[Response | None, Request]:
-        req = yield None
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        # receiving messages is tested elewhere, we just do a basic check here
-        assert req.url.params['Action'] == 'ReceiveMessage'
-        req = yield Response(
-            status_code=200,
-            json={
-                'ReceiveMessageResponse': {
-                    'ReceiveMessageResult': {
-                        'messages': [
-                            {
-                                'MessageId': 'message-id-1234',
-                                'ReceiptHandle': 'receipt_handle',
-                                'MD5OfBody': 'body-md5-123',
-                                'Body': 'foo bar',
-                                'Attributes': {},
-                            }
-                        ]
-                    }
-                }
-            },
-        )
-        # now we should get a request to delete the message
-        assert request_url == queue_url
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        expected_params = {'Action': 'DeleteMessage', 'ReceiptHandle': 'receipt_handle'}
-        for param, expected_val in expected_params.items():
-            assert req.url.params[param] == expected_val
-        assert req.headers['Accept'] == 'application/json'
-        # not checking auth header values, tested elsewhere
-        expected_auth_headers = {'x-amz-date', 'authorization', 'x-amz-content-sha256'}
-        for header in expected_auth_headers:
-            assert header in req.headers
-        req = yield Response(
-            status_code=200,
-            json={},  # we don't exepct any particular response
-        )
-
-    handler = stateful_handler()
-    await handler.__anext__()  # prime the generator
+    transport.assert_all_called()
 
-    client = AsyncClient(transport=MockTransport(handler.asend))
 
-    queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/MyQueue'
-
-    sqs = SQSClient(
-        queue_name_or_url=queue_url,
-        auth=AWSAuthConfig(
-            aws_access_key='test_access_key',
-            aws_secret_key='test_secret_key',
-            aws_region='testing-region-1',
-        ),
-        client=client,
+async def test_delete_message(build_sqs_client) -> None:
+    transport = SequencedMockTransport(
+        [
+            # receiving messages is tested elsewhere, we just do a basic check here
+            (queue_url, {'Action': 'ReceiveMessage'}, receive_message_json),
+            # we don't expect any particular response
+            (queue_url, {'Action': 'DeleteMessage', 'ReceiptHandle': 'receipt_handle'}, {}),
+        ]
     )
+    client = AsyncClient(transport=transport)
+
+    sqs = build_sqs_client(queue_url, client)
 
     # receive 1 batch of messages
     async for received_messages in sqs.poll():
@@ -214,87 +154,165 @@ async def test_delete_message() -> None:
             await sqs.delete_message(message)
         break
 
-    try:
-        await handler.__anext__()
-    except StopAsyncIteration:
-        pass
-    else:
-        raise AssertionError('Missing API calls')
-
-
-async def test_get_queue_url() -> None:
-    async def stateful_handler() -> AsyncGenerator[Response | None, Request]:
-        req = yield None
-        # check that we request the queue url
-        request_url = req.url.copy_with(params={})
-        assert request_url == 'https://sqs.testing-region-1.amazonaws.com'
-        expected_params = {'Action': 'GetQueueUrl', 'QueueName': 'test'}
-        for param, expected_val in expected_params.items():
-            assert req.url.params[param] == expected_val
-        assert req.headers['Accept'] == 'application/json'
-        # not checking auth header values, tested elsewhere
-        expected_auth_headers = {'x-amz-date', 'authorization', 'x-amz-content-sha256'}
-        for header in expected_auth_headers:
-            assert header in req.headers
-        queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/test'
-        req = yield Response(
-            status_code=200,
-            json={
-                'GetQueueUrlResponse': {
-                    'GetQueueUrlResult': {
-                        'QueueUrl': queue_url,
-                    }
-                }
-            },
-        )
+    transport.assert_all_called()
+
+
+async def test_get_queue_url(build_sqs_client) -> None:
+    test_queue_url = 'https://sqs.us-east-2.amazonaws.com/123456789012/test'
+    transport = SequencedMockTransport(
+        [
+            # check that we request the queue url
+            (
+                'https://sqs.testing-region-1.amazonaws.com',
+                {'Action': 'GetQueueUrl', 'QueueName': 'test'},
+                {'GetQueueUrlResponse': {'GetQueueUrlResult': {'QueueUrl': test_queue_url}}},
+            ),
+            # receiving messages is tested elsewhere, we just do a basic check here
+            (test_queue_url, {'Action': 'ReceiveMessage'}, receive_message_json),
+        ]
+    )
+    client = AsyncClient(transport=transport)
 
-        # receiving messages is tested elewhere, we just do a basic check here
-        request_url = req.url.copy_with(params={})
-        assert request_url == queue_url
-        assert req.url.params['Action'] == 'ReceiveMessage'
-        req = yield Response(
-            status_code=200,
-            json={
-                'ReceiveMessageResponse': {
-                    'ReceiveMessageResult': {
-                        'messages': [
-                            {
-                                'MessageId': 'message-id-1234',
-                                'ReceiptHandle': 'receipt_handle',
-                                'MD5OfBody': 'body-md5-123',
-                                'Body': 'foo bar',
-                                'Attributes': {},
-                            }
-                        ]
-                    }
-                }
-            },
-        )
+    sqs = build_sqs_client('test', client)
 
-    handler = stateful_handler()
-    await handler.__anext__()  # prime the generator
+    # receive 1 batch of messages
+    async for _ in sqs.poll():
+        break
 
-    client = AsyncClient(transport=MockTransport(handler.asend))
+    transport.assert_all_called()
 
-    queue_name = 'test'
 
-    sqs = SQSClient(
-        queue_name_or_url=queue_name,
-        auth=AWSAuthConfig(
-            aws_access_key='test_access_key',
-            aws_secret_key='test_secret_key',
-            aws_region='testing-region-1',
-        ),
-        client=client,
+@pytest.mark.parametrize('http2', [False, True])
+async def test_create_sqs_client_default_client(mocker, http2: bool) -> None:
+    # http2 is only enabled when h2 is installed
+    mocker.patch('aioaws.sqs._http2', http2)
+    client = AsyncClient()
+    async_client = mocker.patch('aioaws.sqs.AsyncClient', return_value=client)
+    async with create_sqs_client(queue_url, sqs_auth) as sqs:
+        assert sqs._client is client
+    async_client.assert_called_once_with(
+        limits=Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=30), http2=http2
     )
 
-    # receive 1 batch of messages
+
+async def test_create_sqs_client_custom_client(mocker) -> None:
+    async_client = mocker.patch('aioaws.sqs.AsyncClient', wraps=AsyncClient)
+    async with AsyncClient() as client, create_sqs_client(queue_url, sqs_auth, client=client) as sqs:
+        assert sqs._client is client
+    async_client.assert_not_called()
+
+
+async def test_poll_signing_key_derived_once(build_sqs_client, mocker) -> None:
+    # the signing key cache is module level, clear it so the result doesn't depend on which tests ran before
+    core._aws4_derive_signing_key.cache_clear()
+    client = AsyncClient(transport=MockTransport(lambda request: Response(200, json=receive_message_json)))
+    sqs = build_sqs_client(queue_url, client)
+    hmac_digest = mocker.spy(hmac, 'digest')
+
+    polls = 0
     async for _ in sqs.poll():
-        break
+        polls += 1
+        if polls == 100:
+            break
+
+    # the signing key is derived once and then reused for every request
+    cache_info = core._aws4_derive_signing_key.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 99)
+    # 4 HMACs to derive the signing key, then a single HMAC to sign each request
+    assert hmac_digest.call_count == 4 + 100
+
+
+async def test_poll_concurrency(build_sqs_client) -> None:
+    in_flight = 0
+    max_in_flight = 0
+    requests = 0
+
+    async def handler(request: Request) -> Response:
+        nonlocal in_flight, max_in_flight, requests
+        assert request.url.params['Action'] == 'ReceiveMessage'
+        requests += 1
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            in_flight -= 1
+        return Response(200, json=receive_message_json)
+
+    sqs = build_sqs_client(queue_url, AsyncClient(transport=MockTransport(handler)))
+
+    polls = sqs.poll(config=PollConfig(concurrency=3))
+    batches = [await anext(polls) for _ in range(5)]
+    await polls.aclose()
+
+    assert [len(list(b)) for b in batches] == [1] * 5
+    assert max_in_flight == 3
+    # closing the generator cancelled the outstanding requests and no more are made
+    assert in_flight == 0
+    made_requests = requests
+    await asyncio.sleep(0.02)
+    assert requests == made_requests
+
+
+async def test_poll_concurrency_error(build_sqs_client) -> None:
+    sqs = build_sqs_client(queue_url, AsyncClient(transport=MockTransport(lambda request: Response(500))))
+
+    with pytest.raises(HTTPStatusError):
+        async for _ in sqs.poll(config=PollConfig(concurrency=2)):
+            pass
+
+
+batch_messages = [
+    SQSMessage(message_id=f'id-{i}', receipt_handle=f'handle-{i}', md5_of_body='md5', body='foo', attributes={})
+    for i in range(12)
+]
+
+
+def batch_error(entry_id: str) -> dict[str, Any]:
+    return {'Id': entry_id, 'Code': 'ReceiptHandleIsInvalid', 'Message': 'invalid', 'SenderFault': True}
+
+
+def delete_batch_json(successful: Iterable[int], failed: Iterable[str] = (), failed_key='Failed') -> dict[str, Any]:
+    result = {'Successful': [{'Id': str(i)} for i in successful], failed_key: [batch_error(i) for i in failed] or None}
+    return {'DeleteMessageBatchResponse': {'DeleteMessageBatchResult': result}}
+
+
+async def test_delete_messages(build_sqs_client) -> None:
+    def delete_params(handles: range) -> dict[str, str]:
+        params = {'Action': 'DeleteMessageBatch'}
+        for i, h in enumerate(handles, start=1):
+            params[f'DeleteMessageBatchRequestEntry.{i}.Id'] = str(i)
+            params[f'DeleteMessageBatchRequestEntry.{i}.ReceiptHandle'] = f'handle-{h}'
+        return params
+
+    transport = SequencedMockTransport(
+        [
+            (queue_url, delete_params(range(10)), delete_batch_json(successful=range(1, 11))),
+            (queue_url, delete_params(range(10, 12)), delete_batch_json(successful=range(1, 3))),
+        ]
+    )
+    client = AsyncClient(transport=transport)
+
+    sqs = build_sqs_client(queue_url, client)
+
+    assert await sqs.delete_messages(batch_messages) == []
+    transport.assert_all_called()
+
+
+@pytest.mark.parametrize('failed_key', ['Failed', 'failed'])
+async def test_delete_messages_partial_failure(build_sqs_client, failed_key: str) -> None:
+    transport = SequencedMockTransport(
+        [
+            (
+                queue_url,
+                {'Action': 'DeleteMessageBatch'},
+                delete_batch_json([1, 2, 4, 5, 6, 7, 8, 9, 10], ['3'], failed_key),
+            ),
+            (queue_url, {'Action': 'DeleteMessageBatch'}, delete_batch_json([1], ['2'], failed_key)),
+        ]
+    )
+    sqs = build_sqs_client(queue_url, AsyncClient(transport=transport))
 
-    try:
-        await handler.__anext__()
-    except StopAsyncIteration:
-        pass
-    else:
-        raise AssertionError('Missing API calls')
+    failed = await sqs.delete_messages(batch_messages)
+    assert [m.receipt_handle for m in failed] == ['handle-2', 'handle-11']
+    transport.assert_all_called()
@@ -1,5 +1,12 @@
+import asyncio
+import base64
+import hashlib
+import xml.dom.minidom
+from datetime import datetime, timezone
+from urllib.parse import quote
+
 import pytest
-from httpx import AsyncClient
+from httpx import URL, AsyncClient
 
 from aioaws import _types, _utils, core
 
@@ -23,7 +30,6 @@ def test_types():
     assert hasattr(_types, 'S3ConfigProtocol')
 
 
-@pytest.mark.asyncio
 async def test_response_error_xml(client: AsyncClient):
     response = await client.get(f'http://localhost:{client.port}/xml-error/')
     assert response.status_code == 456
@@ -31,7 +37,6 @@ async def test_response_error_xml(client: AsyncClient):
     assert str(e).endswith('(XML formatted by aioaws)')
 
 
-@pytest.mark.asyncio
 async def test_response_error_not_xml(client: AsyncClient):
     response = await client.get(f'http://localhost:{client.port}/status/400/')
     assert response.status_code == 400
@@ -40,3 +45,116 @@ async def test_response_error_not_xml(client: AsyncClient):
         f'unexpected response from GET "http://localhost:{client.port}/status/400/": 400, response:\n'
         'test response with status 400'
     )
+
+
+@pytest.mark.parametrize(
+    'body,parsed,formatted',
+    [
+        (b'<Error><Code>Foo</Code></Error>', True, True),
+        (b'  \n<Error><Code>Foo</Code></Error>', True, True),
+        (b'<notxml', True, False),
+        (b'not xml', False, False),
+        (b'', False, False),
+    ],
+)
+def test_pretty_xml(mocker, body: bytes, parsed: bool, formatted: bool):
+    parse_string = mocker.spy(xml.dom.minidom, 'parseString')
+    text = _utils.pretty_xml(body)
+    assert parse_string.call_count == parsed
+    if formatted:
+        assert text.endswith('<Code>Foo</Code>\n</Error>\n (XML formatted by aioaws)')
+    else:
+        assert text == body.decode()
+
+
+def test_json_loads():
+    assert _utils.json_loads('{"a": [1, "\u00a3"]}'.encode()) == {'a': [1, '£']}
+
+
+def test_empty_payload_hashes():
+    # hard coded to avoid hashing an empty body on every GET request
+    assert core._EMPTY_SHA256 == hashlib.sha256(b'').hexdigest()
+    assert core._EMPTY_MD5 == base64.b64encode(hashlib.md5(b'').digest()).decode()
+
+
+def test_signing_key_cached():
+    auth = core.AWSv4Auth(aws_secret_key='testing', aws_access_key='testing', region='testing', service='sqs')
+    key = auth._aws4_signing_key('20320101')
+    assert auth._aws4_signing_key('20320101') is key
+    assert auth._aws4_signing_key('20320102') != key
+
+    # shared between instances with the same credentials
+    auth2 = core.AWSv4Auth(aws_secret_key='testing', aws_access_key='testing', region='testing', service='sqs')
+    assert auth2._aws4_signing_key('20320101') is key
+    other_secret = core.AWSv4Auth(aws_secret_key='other', aws_access_key='testing', region='testing', service='sqs')
+    assert other_secret._aws4_signing_key('20320101') != key
+
+
+def test_auth_headers_authorization(mocker):
+    auth = core.AWSv4Auth(aws_secret_key='testing', aws_access_key='testing', region='testing', service='sqs')
+    url = URL('https://sqs.testing.amazonaws.com/123/q?Action=ReceiveMessage')
+    utcnow = mocker.patch('aioaws.core.utcnow', return_value=datetime(2032, 1, 1, tzinfo=timezone.utc))
+    prefix = (
+        'AWS4-HMAC-SHA256 Credential=testing/20320101/testing/sqs/aws4_request,'
+        'SignedHeaders=content-md5;content-type;host;x-amz-date,Signature='
+    )
+    signature = 'ccc5de64b19997a02779fa90ef29a896c20fd840423d534e858c8f5f4f801284'
+    assert auth.auth_headers('GET', url)['authorization'] == prefix + signature
+    # the cached prefix is reused
+    assert auth.auth_headers('GET', url)['authorization'] == prefix + signature
+
+    # and rebuilt when the date changes
+    utcnow.return_value = datetime(2032, 1, 2, tzinfo=timezone.utc)
+    assert auth.auth_headers('GET', url)['authorization'] == (
+        'AWS4-HMAC-SHA256 Credential=testing/20320102/testing/sqs/aws4_request,'
+        'SignedHeaders=content-md5;content-type;host;x-amz-date,'
+        'Signature=402a0557f0dd54bd6bd4ef714ee652a9bd2688727b3fdc78ac934bcf2c2bb978'
+    )
+
+
+async def test_many_tasks():
+    async def double(v):
+        await asyncio.sleep(0)
+        return v * 2
+
+    tasks = _utils.ManyTasks()
+    assert await tasks.finish() == []
+    for i in range(5):
+        tasks.add(double(i))
+    assert await tasks.finish() == [0, 2, 4, 6, 8]
+    tasks.add(double(10))
+    assert await tasks.finish() == [20]
+
+
+async def test_many_tasks_error():
+    async def fail():
+        raise ValueError('broken')
+
+    tasks = _utils.ManyTasks()
+    tasks.add(fail())
+    with pytest.raises(ValueError, match='broken'):
+        await tasks.finish()
+
+
+async def test_many_tasks_cancel():
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    tasks = _utils.ManyTasks()
+    tasks.add(slow())
+    tasks.add(slow())
+    children = list(tasks._tasks)
+    finish = asyncio.create_task(tasks.finish())
+    await started.wait()
+    finish.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await finish
+    assert all(t.cancelled() for t in children)
+
+
+@pytest.mark.parametrize('path', ['', '/', '/foo/bar-baz_1.2~3.txt', '/foo bar.txt', '/£££.txt', '/a+b=c&d'])
+def test_aws4_quote_path(path):
+    assert core._aws4_quote_path(path) == quote(path)